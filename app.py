@@ -1,12 +1,18 @@
 import os
-import io
+import json
+import time
 import logging
+import mimetypes
 import base64
 import tempfile
-from datetime import datetime
 from flask import Flask, render_template, request, jsonify, send_file, Response
 from werkzeug.utils import secure_filename
-from utils import process_video
+from job_queue import RenderJobQueue, DEFAULT_PRIORITY, PREVIEW_PRIORITY, RENDER_MODES
+from output_profile import OutputProfile
+from filters import item_filters, build_filters
+from utils import FIT_MODES, INTERPOLATIONS, check_transition_options
+from file_manager import FileManager, FINAL_STAGES
+from media_store import MediaStore, UploadOffsetError
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,12 +22,20 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
-ALLOWED_EXTENSIONS = {'mp4', 'jpg', 'jpeg', 'png', 'gif'}
+ALLOWED_EXTENSIONS = {'mp4', 'jpg', 'jpeg', 'png', 'gif', 'mp3', 'wav', 'm4a'}
 MAX_CONTENT_LENGTH = 64 * 1024 * 1024  # 16MB max file size
 
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 8 * 1024 * 1024 * 1024))  # Chunked uploads, 8GB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+PREVIEW_SCALE = 0.25
+PREVIEW_PROFILE = 'draft'
+
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
 
+# Expired uploads, media and render outputs are removed in the background
+FileManager.get_instance().start_cleanup()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -52,28 +66,14 @@ def upload_file():
 
         if file:
             try:
-                # Save file to temp directory first
                 filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                unique_filename = timestamp + filename
-                temp_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-                file.save(temp_path)
-
-                # Read file data and encode as base64
-                with open(temp_path, 'rb') as f:
-                    file_data = base64.b64encode(f.read()).decode('utf-8')
-
-                # Clean up temp file
-                try:
-                    os.unlink(temp_path)
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file {temp_path}: {str(e)}")
+                extension = os.path.splitext(filename)[1]
+                media_id = MediaStore.get_instance().save_stream(file.stream, extension)
 
                 return jsonify({
                     'success': True,
-                    'filename': unique_filename,
-                    'file_data': file_data,
+                    'media_id': media_id,
+                    'filename': filename,
                     'mime_type': file.content_type
                 })
             except Exception as e:
@@ -84,6 +84,127 @@ def upload_file():
         logger.error(f"Upload error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/uploads', methods=['POST'])
+def begin_upload():
+    try:
+        data = request.get_json()
+        if not data or not data.get('filename') or 'size' not in data:
+            return jsonify({'error': 'Invalid request data'}), 400
+
+        filename = secure_filename(data['filename'])
+        if not allowed_file(filename):
+            return jsonify({'error': 'Invalid file type'}), 400
+
+        size = int(data['size'])
+        if size <= 0 or size > MAX_UPLOAD_SIZE:
+            return jsonify({'error': f'File size must be between 1 and {MAX_UPLOAD_SIZE} bytes'}), 400
+
+        upload_id = MediaStore.get_instance().begin_upload(filename, size, data.get('sha256'))
+        return jsonify({
+            'success': True,
+            'upload_id': upload_id,
+            'offset': 0,
+            'chunk_size': UPLOAD_CHUNK_SIZE
+        }), 201
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Upload init error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        session = MediaStore.get_instance().get_upload(upload_id)
+    except LookupError:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+    return jsonify({
+        'upload_id': upload_id,
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': session['offset'],
+        'chunk_size': UPLOAD_CHUNK_SIZE
+    })
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get('offset', 0))
+        # Read the raw body in pieces instead of letting Werkzeug buffer it
+        offset = MediaStore.get_instance().write_chunk(upload_id, offset, request.stream)
+        return jsonify({'success': True, 'offset': offset})
+    except LookupError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except UploadOffsetError as e:
+        return jsonify({'error': str(e), 'offset': e.expected_offset}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Upload chunk error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    try:
+        media_id, session = MediaStore.get_instance().finalize_upload(upload_id)
+        return jsonify({
+            'success': True,
+            'media_id': media_id,
+            'filename': session['filename'],
+            'mime_type': mimetypes.guess_type(session['filename'])[0]
+        })
+    except LookupError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except UploadOffsetError as e:
+        return jsonify({'error': 'Upload incomplete', 'offset': e.expected_offset}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Upload finalize error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/media/<media_id>', methods=['GET'])
+def get_media(media_id):
+    path = MediaStore.get_instance().get_path(media_id)
+    if not path:
+        return jsonify({'error': 'Unknown media'}), 404
+    return send_file(path, conditional=True)
+
+def resolve_timeline(timeline):
+    """Replace media ids in timeline items with paths into the media store."""
+    media_store = MediaStore.get_instance()
+    resolved = []
+    for item in timeline:
+        path = media_store.get_path(item.get('media_id'))
+        if not path:
+            raise LookupError(f"Unknown media id for {item.get('filename', 'timeline item')}")
+        # Keep media referenced by a render from expiring while it is queued
+        FileManager.get_instance().track_file(path)
+        item_copy = item.copy()
+        item_copy['filepath'] = path
+        resolved.append(item_copy)
+    return resolved
+
+def parse_preview(preview):
+    """Validate preview options; true or {} selects the defaults.
+
+    Accepts {'scale': 0 < s <= 1, 'time_range': [start, end]} in seconds.
+    """
+    options = preview if isinstance(preview, dict) else {}
+    scale = float(options.get('scale', PREVIEW_SCALE))
+    if not 0 < scale <= 1:
+        raise ValueError('scale must be in (0, 1]')
+
+    time_range = options.get('time_range')
+    if time_range is not None:
+        start, end = (float(value) for value in time_range)
+        if start < 0 or end <= start:
+            raise ValueError('time_range must be [start, end] with 0 <= start < end')
+        time_range = (start, end)
+    return {'scale': scale, 'time_range': time_range}
+
 @app.route('/process', methods=['POST'])
 def process():
     try:
@@ -102,71 +223,174 @@ def process():
             height = int(data['resolution'].get('height', 1080))
             target_resolution = (width, height)
 
-        # Get background audio if provided
-        background_audio = data.get('background_audio')
+        try:
+            timeline = resolve_timeline(timeline)
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Each item may chain several filters, e.g. [{'name': 'blur', 'radius': 4}, 'sepia'],
+        # and picks how it fits the frame
+        for item in timeline:
+            try:
+                build_filters(item_filters(item))
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': f"Invalid filters for {item.get('filename', 'timeline item')}: {str(e)}"}), 400
+            if item.get('fit', 'contain') not in FIT_MODES:
+                return jsonify({'error': f"Invalid fit for {item.get('filename', 'timeline item')}: "
+                                         f"must be one of {', '.join(FIT_MODES)}"}), 400
+            if item.get('interpolation') and item['interpolation'] not in INTERPOLATIONS:
+                return jsonify({'error': f"Invalid interpolation for {item.get('filename', 'timeline item')}: "
+                                         f"must be one of {', '.join(INTERPOLATIONS)}"}), 400
+            try:
+                check_transition_options(item.get('transitionOptions'))
+            except ValueError as e:
+                return jsonify({'error': f"Invalid transitionOptions for {item.get('filename', 'timeline item')}: "
+                                         f"{str(e)}"}), 400
+
+        # Get background audio if provided, either as a stored media id or inline base64
+        background_audio = None
+        if data.get('background_audio_id'):
+            background_audio = MediaStore.get_instance().get_path(data['background_audio_id'])
+            if not background_audio:
+                return jsonify({'error': 'Unknown background audio id'}), 400
+            # Like timeline media, keep it from expiring while the render is queued
+            FileManager.get_instance().track_file(background_audio)
+        elif data.get('background_audio'):
+            media_id = MediaStore.get_instance().save_bytes(base64.b64decode(data['background_audio']), '.mp3')
+            background_audio = MediaStore.get_instance().get_path(media_id)
+
         if background_audio:
             logger.info("Background audio received in request")
         else:
             logger.info("No background audio in request")
 
-        # Create temporary files for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
+        # Previews render small and fast, optionally only part of the timeline, ahead of exports
+        preview = None
+        # An empty options object ({}) still asks for a preview with the defaults
+        if data.get('preview') not in (None, False):
             try:
-                # Process each timeline item
-                processed_timeline = []
-                for item in timeline:
-                    if 'file_data' in item:
-                        # Decode base64 data and save to temp file
-                        file_data = base64.b64decode(item['file_data'])
-                        temp_path = os.path.join(temp_dir, item['filename'])
-                        with open(temp_path, 'wb') as f:
-                            f.write(file_data)
-                        item_copy = item.copy()
-                        item_copy['filepath'] = temp_path
-                        processed_timeline.append(item_copy)
-
-                # Create output file
-                with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_output:
-                    try:
-                        logger.info("Starting video processing with parameters: resolution=%s, background_audio=%s", 
-                                  target_resolution, "present" if background_audio else "absent")
-                        # Process video with the processed timeline
-                        process_video(processed_timeline, temp_output.name, target_resolution, background_audio)
-
-                        # Read the processed video file
-                        with open(temp_output.name, 'rb') as f:
-                            video_data = f.read()
-
-                        # Generate unique output filename
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        output_filename = f'output_{timestamp}.mp4'
-
-                        logger.info("Video processing completed successfully")
-                        # Create response
-                        return send_file(
-                            io.BytesIO(video_data),
-                            mimetype='video/mp4',
-                            as_attachment=True,
-                            download_name=output_filename
-                        )
-                    except Exception as e:
-                        logger.error(f"Error during video processing: {str(e)}", exc_info=True)
-                        raise
-                    finally:
-                        # Clean up output file
-                        try:
-                            os.unlink(temp_output.name)
-                        except Exception as e:
-                            logger.error(f"Failed to cleanup temp output file: {str(e)}")
+                preview = parse_preview(data['preview'])
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': f'Invalid preview: {str(e)}'}), 400
 
-            except Exception as e:
-                logger.error(f"Processing error in temp directory: {str(e)}", exc_info=True)
-                raise
+        try:
+            priority = int(data.get('priority', PREVIEW_PRIORITY if preview else DEFAULT_PRIORITY))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'priority must be an integer'}), 400
+
+        # 'segments' renders each item in parallel and joins them without re-encoding
+        render_mode = data.get('render_mode', 'composite')
+        if render_mode not in RENDER_MODES:
+            return jsonify({'error': f"render_mode must be one of {', '.join(RENDER_MODES)}"}), 400
+        if preview:
+            render_mode = 'composite'
+
+        # Encoder settings: a preset name ('draft', 'web', 'archive') or an object of overrides
+        try:
+            profile = OutputProfile.from_request(data.get('profile', PREVIEW_PROFILE if preview else None))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid profile: {str(e)}'}), 400
+
+        logger.info("Queueing video processing with parameters: resolution=%s, background_audio=%s",
+                    target_resolution, "present" if background_audio else "absent")
+        job_queue = RenderJobQueue.get_instance()
+        job_id = job_queue.submit(timeline, target_resolution, background_audio, priority, render_mode, profile,
+                                  preview)
+
+        # A render cache hit is done already
+        job = job_queue.get_job(job_id)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': job['status'],
+            'cached': job['cached']
+        }), 200 if job['cached'] else 202
 
     except Exception as e:
         logger.error(f"Processing error: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job_queue = RenderJobQueue.get_instance()
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    expires_at = FileManager.get_instance().get_expiry(job['output_path'])
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'priority': job['priority'],
+        'render_mode': job['render_mode'],
+        'profile': job['profile'],
+        'preview': job['preview'],
+        'cached': job['cached'],
+        'queue_position': job_queue.queue_position(job_id),
+        'created_at': job['created_at'].isoformat(),
+        'started_at': job['started_at'].isoformat() if job['started_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+        'error': job['error'],
+        'expires_at': expires_at.isoformat() if expires_at else None,
+        'progress': FileManager.get_instance().get_processing_progress(job_id)
+    })
+
+@app.route('/jobs/<job_id>/progress', methods=['GET'])
+def job_progress(job_id):
+    progress = FileManager.get_instance().get_processing_progress(job_id)
+    if not progress:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(progress)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    file_manager = FileManager.get_instance()
+    if not file_manager.get_processing_progress(job_id):
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def stream():
+        last_sent = None
+        while True:
+            progress = file_manager.get_processing_progress(job_id)
+            if progress is None:
+                break
+            if progress != last_sent:
+                yield f"data: {json.dumps(progress)}\n\n"
+                last_sent = progress
+            if progress['stage'] in FINAL_STAGES:
+                break
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    job = RenderJobQueue.get_instance().get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Job is {job['status']}"}), 409
+    if not os.path.exists(job['output_path']):
+        return jsonify({'error': 'Output no longer available'}), 410
+
+    # Served straight from disk; conditional responses honour Range requests
+    # so the browser can seek in previews and downloads can resume
+    timestamp = job['finished_at'].strftime('%Y%m%d_%H%M%S')
+    extension = os.path.splitext(job['output_path'])[1]
+    return send_file(
+        job['output_path'],
+        mimetype=mimetypes.guess_type(job['output_path'])[0] or 'application/octet-stream',
+        as_attachment=request.args.get('inline') != '1',
+        download_name=f'output_{timestamp}{extension}',
+        conditional=True
+    )
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def job_release(job_id):
+    if not RenderJobQueue.get_instance().release_output(job_id):
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify({'success': True})
+
 @app.after_request
 def add_header(response):
     response.headers['Cache-Control'] = 'no-store'
@@ -0,0 +1,110 @@
+"""Per-frame cost of the warp transitions before and after the geometry cache.
+
+Usage: python benchmarks/warp_transitions.py [--width 1920] [--height 1080] [--frames 24]
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+import moviepy.editor as mp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import apply_transition  # noqa: E402
+
+
+def legacy_swirl(frame, progress):
+    h, w = frame.shape[:2]
+    center = (w / 2, h / 2)
+    angle_offset = 2 * np.pi * (1 - progress)
+    X, Y = np.meshgrid(np.arange(w), np.arange(h))
+    Xc = X - center[0]
+    Yc = Y - center[1]
+    theta = np.arctan2(Yc, Xc) + angle_offset * np.exp(-((Xc**2 + Yc**2) / (2*(max(w, h)/2)**2)))
+    radius = np.sqrt(Xc**2 + Yc**2)
+    map_x = (radius * np.cos(theta) + center[0]).astype(np.float32)
+    map_y = (radius * np.sin(theta) + center[1]).astype(np.float32)
+    return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+
+def legacy_wave(frame, progress):
+    h, w = frame.shape[:2]
+    amplitude = 10 * (1 - progress)
+    X, Y = np.meshgrid(np.arange(w), np.arange(h))
+    shift = amplitude * np.sin(2 * np.pi * Y / 30 * 2)
+    map_x = (X + shift).astype(np.float32)
+    map_y = Y.astype(np.float32)
+    return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+
+def legacy_ripple(frame, progress):
+    h, w = frame.shape[:2]
+    center = (w / 2, h / 2)
+    amplitude = 5 * (1 - progress)
+    X, Y = np.meshgrid(np.arange(w), np.arange(h))
+    distance = np.sqrt((X - center[0])**2 + (Y - center[1])**2)
+    displacement = amplitude * np.sin(2 * np.pi * distance / 20)
+    dx = displacement * (X - center[0]) / (distance + 1e-5)
+    dy = displacement * (Y - center[1]) / (distance + 1e-5)
+    map_x = (X + dx).astype(np.float32)
+    map_y = (Y + dy).astype(np.float32)
+    return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+
+def legacy_spiral(frame, progress):
+    h, w = frame.shape[:2]
+    center = (w / 2, h / 2)
+    angle_offset = 2 * np.pi * (1 - progress)
+    X, Y = np.meshgrid(np.arange(w), np.arange(h))
+    Xc = X - center[0]
+    Yc = Y - center[1]
+    radius = np.sqrt(Xc**2 + Yc**2)
+    theta = np.arctan2(Yc, Xc) + angle_offset
+    map_x = (radius * np.cos(theta) + center[0]).astype(np.float32)
+    map_y = (radius * np.sin(theta) + center[1]).astype(np.float32)
+    return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+
+LEGACY = {
+    'swirl': legacy_swirl,
+    'wave': legacy_wave,
+    'ripple': legacy_ripple,
+    'spiral': legacy_spiral
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=24)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    clip = mp.ImageClip(frame).set_duration(2.0)
+    # Sample the transition window, leaving out progress 1 where nothing moves
+    times = np.linspace(0, 1.0, args.frames, endpoint=False)
+
+    print(f"{args.width}x{args.height}, {args.frames} frames per transition")
+    print(f"{'transition':<10} {'before ms':>10} {'after ms':>10} {'speedup':>8} {'max diff':>9}")
+    for name, legacy in LEGACY.items():
+        transitioned = apply_transition(clip, f'{name}-in', duration=1.0)
+        transitioned.get_frame(0)  # The first frame pays for building the geometry
+
+        start = time.perf_counter()
+        expected = [legacy(frame, t) for t in times]
+        before = (time.perf_counter() - start) / len(times)
+
+        start = time.perf_counter()
+        actual = [transitioned.get_frame(t) for t in times]
+        after = (time.perf_counter() - start) / len(times)
+
+        diff = max(int(np.abs(a.astype(np.int16) - e).max()) for a, e in zip(actual, expected))
+        print(f"{name:<10} {before * 1000:>10.1f} {after * 1000:>10.1f} {before / after:>7.1f}x {diff:>9}")
+
+
+if __name__ == '__main__':
+    main()
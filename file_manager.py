@@ -2,10 +2,22 @@ import os
 import glob
 from datetime import datetime, timedelta
 import logging
-from threading import Lock
+from threading import Lock, Thread, Event
 
 logger = logging.getLogger(__name__)
 
+# Share of the overall progress bar covered by each render stage
+PROGRESS_STAGES = {
+    'queued': (0, 0),
+    'decode': (0, 5),
+    'filter': (5, 10),
+    'audio': (10, 15),
+    'encode': (15, 100),
+    'done': (100, 100),
+    'failed': (100, 100)
+}
+FINAL_STAGES = ('done', 'failed')
+
 class FileManager:
     _instance = None
     _lock = Lock()
@@ -13,8 +25,11 @@ class FileManager:
     def __init__(self, upload_folder):
         self.upload_folder = upload_folder
         self.tracked_files = {}
-        self.processing_progress = 0
+        self.processing_progress = {}
         self.file_expiry = timedelta(hours=24)
+        self._files_lock = Lock()
+        self._cleanup_thread = None
+        self._stop_cleanup = Event()
 
     @classmethod
     def get_instance(cls):
@@ -24,47 +39,102 @@ class FileManager:
                     cls._instance = cls(os.path.join(os.getcwd(), 'uploads'))
         return cls._instance
 
-    def track_file(self, filepath):
-        """Track a new file with creation timestamp."""
-        self.tracked_files[filepath] = {
-            'created_at': datetime.now(),
-            'expires_at': datetime.now() + self.file_expiry
-        }
+    def track_file(self, filepath, expiry=None):
+        """Track a new file with creation timestamp.
+
+        Tracking an already tracked file pushes its expiry back.
+        """
+        now = datetime.now()
+        with self._files_lock:
+            self.tracked_files[filepath] = {
+                'created_at': self.tracked_files.get(filepath, {}).get('created_at', now),
+                'expires_at': now + (expiry or self.file_expiry)
+            }
         logger.debug(f"Tracking new file: {filepath}")
 
+    def get_expiry(self, filepath):
+        """Return when a tracked file expires, or None if untracked."""
+        with self._files_lock:
+            info = self.tracked_files.get(filepath)
+            return info['expires_at'] if info else None
+
     def is_tracked(self, filepath):
         """Check if a file is being tracked and not expired."""
-        if filepath not in self.tracked_files:
-            return False
-        
-        file_info = self.tracked_files[filepath]
-        return datetime.now() < file_info['expires_at']
+        with self._files_lock:
+            if filepath not in self.tracked_files:
+                return False
+
+            file_info = self.tracked_files[filepath]
+            return datetime.now() < file_info['expires_at']
+
+    def remove_file(self, filepath):
+        """Delete a tracked file right away and stop tracking it."""
+        with self._files_lock:
+            self.tracked_files.pop(filepath, None)
+        try:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                logger.debug(f"Removed file: {filepath}")
+        except Exception as e:
+            logger.error(f"Failed to remove file {filepath}: {str(e)}")
 
     def cleanup_expired_files(self):
         """Remove expired files and their tracking information."""
         current_time = datetime.now()
-        expired_files = []
-
-        for filepath, info in self.tracked_files.items():
-            if current_time >= info['expires_at']:
-                try:
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                        logger.debug(f"Removed expired file: {filepath}")
-                except Exception as e:
-                    logger.error(f"Failed to remove expired file {filepath}: {str(e)}")
-                expired_files.append(filepath)
-
-        # Remove expired files from tracking
+        with self._files_lock:
+            expired_files = [filepath for filepath, info in self.tracked_files.items()
+                             if current_time >= info['expires_at']]
+            # Remove expired files from tracking
+            for filepath in expired_files:
+                del self.tracked_files[filepath]
+
         for filepath in expired_files:
-            del self.tracked_files[filepath]
+            try:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                    logger.debug(f"Removed expired file: {filepath}")
+            except Exception as e:
+                logger.error(f"Failed to remove expired file {filepath}: {str(e)}")
+
+    def start_cleanup(self, interval_seconds=300):
+        """Run cleanup_expired_files periodically on a background thread."""
+        with self._files_lock:
+            if self._cleanup_thread is not None:
+                return
+
+            def run():
+                while not self._stop_cleanup.wait(interval_seconds):
+                    try:
+                        self.cleanup_expired_files()
+                    except Exception as e:
+                        logger.error(f"Periodic cleanup failed: {str(e)}")
+
+            self._cleanup_thread = Thread(target=run, name='file-cleanup', daemon=True)
+            self._cleanup_thread.start()
+
+    def update_progress(self, job_id, stage, current=0, total=0):
+        """Update the processing progress of a render job."""
+        start, end = PROGRESS_STAGES.get(stage, (0, 0))
+        fraction = min(1, max(0, current / total)) if total else 0
+        with self._lock:
+            previous = self.processing_progress.get(job_id)
+            # Late updates from the worker must not reopen a finished job
+            if previous and previous['stage'] in FINAL_STAGES:
+                return
+            self.processing_progress[job_id] = {
+                'stage': stage,
+                'current': current,
+                'total': total,
+                'progress': round(start + (end - start) * fraction, 1)
+            }
 
-    def update_progress(self, progress):
-        """Update the processing progress."""
+    def get_processing_progress(self, job_id):
+        """Get the current processing progress of a render job."""
         with self._lock:
-            self.processing_progress = min(100, max(0, progress))
+            progress = self.processing_progress.get(job_id)
+            return dict(progress) if progress else None
 
-    def get_processing_progress(self):
-        """Get the current processing progress."""
+    def clear_progress(self, job_id):
+        """Forget the progress of a render job."""
         with self._lock:
-            return self.processing_progress
+            self.processing_progress.pop(job_id, None)
@@ -0,0 +1,167 @@
+import math
+import cv2
+import numpy as np
+
+# Weights of cv2.COLOR_RGB2GRAY
+LUMA = [0.299, 0.587, 0.114]
+# cv2.transform rounds; shifting by just under half a level truncates
+# instead, like the astype(uint8) of the NumPy filters it replaces
+TRUNCATE = -0.4999
+INVERT_LUT = (255 - np.arange(256)).astype(np.uint8)
+
+
+def level_lut(values):
+    """uint8 lookup table: shape (256,) for all channels or (256, 3) per channel."""
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def color_matrix(matrix, offset=0.0):
+    """3x4 float32 matrix for cv2.transform: a 3x3 colour matrix plus an offset column."""
+    affine = np.zeros((3, 4), dtype=np.float32)
+    affine[:, :3] = matrix
+    affine[:, 3] = offset
+    return affine
+
+
+def _permutation(affine):
+    """Source channel of each output channel if affine only reorders channels, else None."""
+    if affine is None:
+        return None
+    matrix = affine[:, :3]
+    if affine[:, 3].any() or not np.isin(matrix, (0, 1)).all():
+        return None
+    if (matrix.sum(axis=0) == 1).all() and (matrix.sum(axis=1) == 1).all():
+        return matrix.argmax(axis=1)
+    return None
+
+
+def _chain(first, second):
+    """The affine matrix applying first, then second (either may be None)."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return color_matrix(second[:, :3] @ first[:, :3], second[:, :3] @ first[:, 3] + second[:, 3])
+
+
+class PointOp:
+    """A point-wise colour operation: an optional 3x4 colour matrix, then a LUT, in at most two passes."""
+
+    def __init__(self, matrix=None, lut=None, name=None):
+        self.matrix = matrix
+        self.lut = lut
+        self.name = name
+        # A grey conversion followed by a per-channel LUT is a colour map, which
+        # cv2.applyColorMap applies to the single grey channel in one pass
+        self._colormap = (matrix is not None and lut is not None and lut.ndim == 2
+                          and bool((matrix == matrix[0]).all()))
+        self._invert = lut is not None and lut.ndim == 1 and np.array_equal(lut, INVERT_LUT)
+
+    @property
+    def is_permutation(self):
+        """True if the op only reorders channels, which commutes with any KernelOp."""
+        return self.lut is None and _permutation(self.matrix) is not None
+
+    def then(self, other):
+        """The single PointOp equal to self followed by other, or None if they don't fuse exactly."""
+        name = f"{self.name}+{other.name}"
+        if other.matrix is None:
+            return PointOp(self.matrix, _compose(self.lut, other.lut), name)
+
+        order = _permutation(other.matrix)
+        if order is not None:
+            # Reordering channels commutes with a per-channel LUT once its columns follow the channels
+            lut = self.lut
+            if lut is not None and lut.ndim == 2:
+                lut = lut[:, order]
+            return PointOp(_chain(self.matrix, other.matrix), _compose(lut, other.lut), name)
+
+        if self.lut is None and (self.matrix is None or _permutation(self.matrix) is not None):
+            return PointOp(_chain(self.matrix, other.matrix), other.lut, name)
+
+        # Rounding and clipping between two mixing matrices can't be folded away
+        return None
+
+    def __call__(self, frame):
+        if self._colormap:
+            if np.allclose(self.matrix[0], LUMA + [0]):
+                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+            else:
+                # A three-row transform is faster than a one-row one
+                gray = cv2.extractChannel(cv2.transform(frame, self.matrix), 0)
+            return cv2.applyColorMap(gray, self.lut.reshape(256, 1, 3))
+        if self.matrix is not None:
+            frame = cv2.transform(frame, self.matrix)
+        if self._invert:
+            return cv2.bitwise_not(frame)
+        if self.lut is not None:
+            # A single table is applied to every channel, which cv2.LUT does faster
+            frame = cv2.LUT(frame, self.lut if self.lut.ndim == 1 else self.lut.reshape(256, 1, 3))
+        return frame
+
+
+def _compose(first, second):
+    """The LUT equal to looking up first, then second."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    if first.ndim == 1 and second.ndim == 1:
+        return second[first]
+    first = first if first.ndim == 2 else np.repeat(first[:, None], 3, axis=1)
+    second = second if second.ndim == 2 else np.repeat(second[:, None], 3, axis=1)
+    return np.take_along_axis(second, first.astype(np.intp), axis=0)
+
+
+def gaussian_sigma(radius):
+    """The sigma cv2.GaussianBlur picks for a (2 * radius + 1)-wide kernel when given 0."""
+    return 0.3 * (radius - 1) + 0.8
+
+
+class KernelOp:
+    """A linear filter applied alike to every channel: a Gaussian blur or a dense cv2.filter2D kernel."""
+
+    def __init__(self, kernel=None, radius=None, sigma=None, name=None):
+        self.kernel = kernel
+        self.radius = radius
+        self.sigma = sigma if sigma is not None or radius is None else gaussian_sigma(radius)
+        self.name = name
+
+    def then(self, other):
+        """The single KernelOp equal to self followed by other, or None if fusing wouldn't pay off."""
+        if self.kernel is None and other.kernel is None:
+            # Two Gaussian blurs are one Gaussian blur whose variance is their sum
+            return KernelOp(radius=math.ceil(math.hypot(self.radius, other.radius)),
+                            sigma=math.hypot(self.sigma, other.sigma), name=f"{self.name}+{other.name}")
+        # Composing dense kernels grows them quadratically; filter2D then runs
+        # slower than the separate passes (a 5x5 costs more than two 3x3s)
+        return None
+
+    def __call__(self, frame):
+        if self.kernel is None:
+            size = 2 * self.radius + 1
+            return cv2.GaussianBlur(frame, (size, size), self.sigma)
+        return cv2.filter2D(frame, -1, self.kernel)
+
+
+def compile_steps(steps):
+    """Fuse a chain of PointOps, KernelOps and frame functions into the steps to run in order.
+
+    Neighbouring ops of the same kind fuse when that is exact and cheaper.
+    """
+    compiled = []
+    for step in steps:
+        reorder = None
+        if isinstance(step, KernelOp) and compiled and getattr(compiled[-1], 'is_permutation', False):
+            reorder = compiled.pop()
+
+        last = compiled[-1] if compiled else None
+        fused = last.then(step) if last is not None and type(last) is type(step) and hasattr(step, 'then') else None
+        if fused is not None:
+            compiled[-1] = fused
+        else:
+            compiled.append(step)
+
+        if reorder is not None:
+            compiled.append(reorder)
+    return compiled
@@ -0,0 +1,367 @@
+from functools import lru_cache
+import cv2
+import numpy as np
+from filter_graph import (PointOp, KernelOp, compile_steps, level_lut, color_matrix, LUMA, TRUNCATE,
+                          INVERT_LUT)
+
+NO_FILTER = 'none'
+# Filters that change from frame to frame even when their input doesn't
+TEMPORAL_FILTERS = ('noise',)
+LEVELS = np.arange(256, dtype=np.float64)
+
+SEPIA_MATRIX = np.array([
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131]
+])
+# Channels (r, g, b) become (g, b, r)
+SHIFT_MATRIX = [[0, 1, 0], [0, 0, 1], [1, 0, 0]]
+# Channels (r, g, b) become (b, g, r)
+SWAP_MATRIX = [[0, 0, 1], [0, 1, 0], [1, 0, 0]]
+EMBOSS_KERNEL = np.array([[-2, -1, 0], [-1, 1, 1], [0, 1, 2]], dtype=np.float32)
+
+
+class FilterSpec:
+    """A registered filter: its settings with their defaults and the factory building its steps."""
+
+    def __init__(self, name, factory, defaults):
+        self.name = name
+        self.factory = factory
+        self.defaults = defaults
+
+    def settings(self, params=None):
+        """The defaults overridden by params, each cast to its default's type."""
+        params = params or {}
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Unknown {self.name} settings: {', '.join(sorted(unknown))}")
+        settings = dict(self.defaults)
+        for key, value in params.items():
+            settings[key] = type(self.defaults[key])(value)
+        return settings
+
+    def build(self, params=None):
+        steps = self.factory(**self.settings(params))
+        steps = steps if isinstance(steps, list) else [steps]
+        for step in steps:
+            if isinstance(step, (PointOp, KernelOp)):
+                step.name = self.name
+        return steps
+
+
+FILTERS = {}
+
+
+def register_filter(name, **defaults):
+    """Register the decorated factory as filter name with the given default settings."""
+    def register(factory):
+        FILTERS[name] = FilterSpec(name, factory, defaults)
+        return factory
+    return register
+
+
+def item_filters(item):
+    """The ordered (name, settings) filter chain of a timeline item; raises ValueError for unknown ones."""
+    entries = item.get('filters')
+    if entries is None:
+        entries = [item['filter']] if item.get('filter') else []
+    if not isinstance(entries, list):
+        raise ValueError('filters must be a list')
+
+    chain = []
+    for entry in entries:
+        if isinstance(entry, str):
+            name, params = entry, {}
+        elif isinstance(entry, dict):
+            name = entry.get('name')
+            params = {key: value for key, value in entry.items() if key != 'name'}
+        else:
+            raise ValueError('each filter must be a name or an object')
+        if name == NO_FILTER:
+            continue
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter '{name}'")
+        chain.append((name, params))
+    return chain
+
+
+def is_temporal(chain):
+    """True if a (name, settings) chain changes frames over time even for a still input."""
+    return any(name in TEMPORAL_FILTERS for name, _ in chain)
+
+
+def build_filters(chain):
+    """Compile a (name, settings) chain into the frame steps to run in order."""
+    steps = []
+    for name, params in chain:
+        steps += FILTERS[name].build(params)
+    return compile_steps(steps)
+
+
+@lru_cache(maxsize=8)
+def filter_overlay(width, height, kind, strength=1.0):
+    """Read-only uint8 RGB overlay of the rainbow or vignette filter, built once per frame size."""
+    if kind == 'rainbow':
+        hue = (np.arange(width) / width * 180).astype(np.uint8)
+        row = np.stack([hue, np.full(width, 255, np.uint8), np.full(width, 255, np.uint8)], axis=-1)
+        overlay = np.broadcast_to(cv2.cvtColor(row[None], cv2.COLOR_HSV2RGB), (height, width, 3)).copy()
+    elif kind == 'vignette':
+        kernel_x = cv2.getGaussianKernel(width, 200)
+        kernel_y = cv2.getGaussianKernel(height, 200)
+        kernel = kernel_y * kernel_x.T
+        mask = kernel / np.linalg.norm(kernel)
+        if strength != 1:
+            # A stronger vignette narrows the Gaussian (sigma / strength) without brightening its centre
+            peak = mask.max()
+            mask = peak * (mask / peak) ** (strength ** 2)
+        # The old per-frame float mask was 255 * mask; stored scaled by another 255 as uint8
+        overlay = cv2.merge([np.clip(np.round(mask * 255 * 255), 0, 255).astype(np.uint8)] * 3)
+    else:
+        raise ValueError(f"Unknown overlay '{kind}'")
+    overlay.flags.writeable = False
+    return overlay
+
+
+# Point-wise filters
+
+def _positive(name, value):
+    if value <= 0:
+        raise ValueError(f'{name} must be positive')
+    return value
+
+
+@register_filter('grayscale')
+def grayscale():
+    return PointOp(matrix=color_matrix(np.full((3, 3), 1 / 3), TRUNCATE))
+
+
+@register_filter('sepia')
+def sepia():
+    return PointOp(matrix=color_matrix(SEPIA_MATRIX, TRUNCATE))
+
+
+@register_filter('bright', factor=1.5)
+@register_filter('dark', factor=0.5)
+def brightness(factor):
+    # vfx.colorx
+    _positive('factor', factor)
+    return PointOp(lut=level_lut(np.floor(np.minimum(255, factor * LEVELS))))
+
+
+@register_filter('contrast', amount=50.0)
+def contrast(amount):
+    # vfx.lum_contrast around 127
+    return PointOp(lut=level_lut(np.floor(np.clip(LEVELS + amount * (LEVELS - 127), 0, 255))))
+
+
+@register_filter('invert')
+def invert():
+    return PointOp(lut=INVERT_LUT)
+
+
+@register_filter('posterize', levels=4)
+def posterize(levels):
+    if not 2 <= levels <= 256:
+        raise ValueError('levels must be between 2 and 256')
+    step = 256 // levels
+    return PointOp(lut=level_lut(LEVELS // step * step))
+
+
+@register_filter('color_shift')
+def color_shift():
+    return PointOp(matrix=color_matrix(SHIFT_MATRIX))
+
+
+@register_filter('thermal')
+def thermal():
+    # applyColorMap returns BGR; the frames are RGB
+    jet = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_JET)
+    return PointOp(matrix=color_matrix([LUMA] * 3), lut=jet.reshape(256, 3)[:, ::-1].copy())
+
+
+# Linear spatial filters
+
+@register_filter('blur', radius=7)
+def blur(radius):
+    return KernelOp(radius=_positive('radius', radius))
+
+
+@register_filter('sharpen', amount=1.0)
+def sharpen(amount):
+    kernel = np.full((3, 3), -amount, dtype=np.float32)
+    kernel[1, 1] = 1 + 8 * amount
+    return KernelOp(kernel=kernel)
+
+
+@register_filter('emboss')
+def emboss():
+    return [KernelOp(kernel=EMBOSS_KERNEL), PointOp(matrix=color_matrix(SWAP_MATRIX))]
+
+
+# Other filters
+
+@register_filter('mirror')
+def mirror():
+    def mirror_frame(frame):
+        # A view, like vfx.mirror_x; OpenCV copes with the negative stride
+        return frame[:, ::-1]
+    return mirror_frame
+
+
+@register_filter('cartoon')
+def cartoon():
+    def cartoonize(frame):
+        # Converte para escala de cinza
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+        # Reduz o blur para manter mais detalhes (de 7 para 3)
+        blurred = cv2.medianBlur(gray, 1)
+
+        # Ajusta o threshold para bordas mais nítidas
+        edges = cv2.adaptiveThreshold(blurred, 255,
+                                      cv2.ADAPTIVE_THRESH_MEAN_C,
+                                      cv2.THRESH_BINARY, 9, 9)
+
+        # Reduz menos as cores para manter detalhes (ajuste nos parâmetros do bilateral)
+        color = cv2.bilateralFilter(frame, 7, 150, 150)
+
+        # Combina as bordas com as cores
+        return cv2.bitwise_and(color, color, mask=edges)
+    return cartoonize
+
+
+@register_filter('oil_painting')
+def oil_painting():
+    def oil_paint(frame):
+        # Convert from RGB (MoviePy) to BGR (OpenCV)
+        frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+        # Apply smoothing to simulate brush strokes
+        smoothed = cv2.medianBlur(frame_bgr, 7)
+
+        # Enhance contrast and brightness
+        enhanced = cv2.convertScaleAbs(smoothed, alpha=1.1, beta=10)  # Menos contraste para evitar exagero
+
+        # Convert to HSV to adjust saturation
+        hsv = cv2.cvtColor(enhanced, cv2.COLOR_BGR2HSV)
+        hsv[:, :, 1] = cv2.multiply(hsv[:, :, 1], 1.40)  # Aumenta saturação em 50%
+
+        # Convert back to RGB
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
+    return oil_paint
+
+
+@register_filter('rainbow')
+def rainbow():
+    def add_rainbow(frame):
+        height, width = frame.shape[:2]
+        return cv2.addWeighted(frame, 0.7, filter_overlay(width, height, 'rainbow'), 0.3, 0)
+    return add_rainbow
+
+
+@register_filter('neon')
+def neon():
+    def neon_effect(frame):
+        # Edge detection
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        edges = cv2.dilate(edges, None)
+        # Create neon effect
+        edges = cv2.GaussianBlur(edges, (9, 9), 0)
+        # Colorize edges
+        edges_color = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+        edges_color[:,:,0] = edges  # Blue channel
+        edges_color[:,:,1] = 0      # Green channel
+        edges_color[:,:,2] = edges  # Red channel
+        # Blend with original
+        return cv2.addWeighted(frame, 0.7, edges_color, 0.3, 0)
+    return neon_effect
+
+
+@register_filter('pencil_sketch')
+def pencil_sketch():
+    def sketch_effect(frame):
+        # Convert to grayscale
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        # Invert
+        inv = 255 - gray
+        # Apply Gaussian blur
+        blurred = cv2.GaussianBlur(inv, (21, 21), 0)
+        # Blend
+        sketch = cv2.divide(gray, 255 - blurred, scale=256.0)
+        # Convert back to RGB
+        return cv2.cvtColor(sketch, cv2.COLOR_GRAY2RGB)
+    return sketch_effect
+
+
+@register_filter('glitch')
+def glitch():
+    def glitch_effect(frame):
+        height, width, _ = frame.shape
+        shift = width // 10
+        frame = frame.copy()
+        frame[:, :shift] = np.flip(frame[:, :shift], axis=1)
+        frame[:, width - shift:] = np.flip(frame[:, width - shift:], axis=1)
+        return frame
+    return glitch_effect
+
+
+@register_filter('pixelate', block=10)
+def pixelate(block):
+    _positive('block', block)
+
+    def pixelate_frame(frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, width // block), max(1, height // block)),
+                           interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+    return pixelate_frame
+
+
+@register_filter('edge_detect')
+def edge_detect():
+    def edge_frame(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        return cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+    return edge_frame
+
+
+@register_filter('solarize')
+def solarize():
+    def solarize_frame(frame):
+        # Converte para escala de cinza para análise de brilho
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        _, mask = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
+
+        # Inverte apenas as áreas brilhantes
+        inverted = cv2.bitwise_not(frame)
+        return np.where(mask[..., None] == 255, inverted, frame)
+    return solarize_frame
+
+
+@register_filter('vignette', strength=1.0)
+def vignette(strength):
+    _positive('strength', strength)
+
+    def vignette_frame(frame):
+        height, width = frame.shape[:2]
+        return cv2.multiply(frame, filter_overlay(width, height, 'vignette', strength), scale=1 / 255)
+    return vignette_frame
+
+
+@register_filter('halftone')
+def halftone():
+    def halftone_frame(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
+        return cv2.cvtColor(binary, cv2.COLOR_GRAY2RGB)
+    return halftone_frame
+
+
+@register_filter('noise', amount=25.0)
+def noise(amount):
+    def add_noise(frame):
+        grain = np.random.normal(0, amount, frame.shape).astype(np.uint8)
+        return cv2.add(frame, grain)
+    return add_noise
@@ -0,0 +1,66 @@
+import os
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """Decoded frames shared by the clips of a render process, keyed by (source id, t).
+
+    Bounded by a byte budget with LRU eviction. Cached frames are read-only.
+    """
+    _instance = None
+    _lock = Lock()
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames_lock = Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls(int(os.environ.get('FRAME_CACHE_MB', 256)) * 1024 * 1024)
+        return cls._instance
+
+    def get_frame(self, source_id, decode, t):
+        """The frame of source_id at time t, calling decode(t) on a miss."""
+        key = (source_id, round(t * 1e6))
+        with self._frames_lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        frame = decode(t)
+        frame.flags.writeable = False
+        if frame.nbytes > self.max_bytes:
+            return frame
+
+        with self._frames_lock:
+            if key not in self.frames:
+                self.frames[key] = frame
+                self.size += frame.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.frames.popitem(last=False)
+                self.size -= evicted.nbytes
+        return frame
+
+    def wrap(self, clip, source_id):
+        """Route clip's decoded frames through the cache; returns clip."""
+        decode = clip.make_frame
+        clip.make_frame = lambda t: self.get_frame(source_id, decode, t)
+        return clip
+
+    def stats(self):
+        with self._frames_lock:
+            return {'hits': self.hits, 'misses': self.misses, 'frames': len(self.frames), 'bytes': self.size}
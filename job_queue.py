@@ -0,0 +1,260 @@
+import os
+import uuid
+import shutil
+import logging
+import itertools
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from functools import partial
+from queue import PriorityQueue
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from file_manager import FileManager
+from output_profile import OutputProfile, DEFAULT_PROFILE
+from render_cache import RenderCache, render_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 10
+PREVIEW_PRIORITY = 0
+RENDER_MODES = ('composite', 'segments')
+
+# Set in each worker process by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _render_job(job_id, timeline, output_path, target_resolution, background_audio, render_mode, profile,
+                preview):
+    """Entry point executed inside a worker process."""
+    def report(stage, current, total):
+        _progress_queue.put((job_id, stage, current, total))
+
+    if render_mode == 'segments':
+        from segment_renderer import render_segments
+        render_segments(timeline, output_path, target_resolution, background_audio, progress_callback=report,
+                        profile=profile)
+    else:
+        from utils import process_video
+        preview = preview or {}
+        process_video(timeline, output_path, target_resolution, background_audio, progress_callback=report,
+                      profile=profile, scale=preview.get('scale', 1.0), time_range=preview.get('time_range'))
+    return output_path
+
+
+class RenderJobQueue:
+    _instance = None
+    _lock = Lock()
+
+    def __init__(self, job_folder, max_workers=2, output_retention=timedelta(hours=1)):
+        self.job_folder = job_folder
+        self.max_workers = max(1, max_workers)
+        self.output_retention = output_retention
+        self.jobs = {}
+        self._payloads = {}
+        self._jobs_lock = Lock()
+        self._queue = PriorityQueue()
+        self._sequence = itertools.count()
+        self._slots = threading.Semaphore(self.max_workers)
+        self._executor = None
+        self._dispatcher = None
+        self._progress_queue = None
+        self._progress_listener = None
+        os.makedirs(self.job_folder, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    max_workers = int(os.environ.get('RENDER_WORKERS', 2))
+                    retention = timedelta(minutes=int(os.environ.get('OUTPUT_RETENTION_MINUTES', 60)))
+                    job_folder = os.path.join(tempfile.gettempdir(), 'render_jobs')
+                    cls._instance = cls(job_folder, max_workers, retention)
+        return cls._instance
+
+    def submit(self, timeline, target_resolution=None, background_audio=None, priority=DEFAULT_PRIORITY,
+               render_mode='composite', profile=None, preview=None):
+        """Queue a render and return its job id; a render cache hit is done right away.
+
+        preview, if given, holds the 'scale' and optional 'time_range' of a draft render.
+        """
+        profile = profile or OutputProfile.named(DEFAULT_PROFILE)
+        # Finished jobs are forgotten once their output expires, keeping the job table small
+        self.prune_jobs()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.job_folder, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'priority': priority,
+            'render_mode': render_mode,
+            'profile': profile.to_dict(),
+            'preview': preview,
+            'created_at': datetime.now(),
+            'started_at': None,
+            'finished_at': None,
+            'output_path': os.path.join(job_dir, 'output' + profile.extension),
+            'cache_key': render_key(timeline, target_resolution, background_audio, render_mode, profile, preview),
+            'cached': False,
+            'error': None
+        }
+        if RenderCache.get_instance().fetch(job['cache_key'], job['output_path']):
+            job['status'] = 'done'
+            job['cached'] = True
+            job['started_at'] = job['finished_at'] = datetime.now()
+            with self._jobs_lock:
+                self.jobs[job_id] = job
+            file_manager = FileManager.get_instance()
+            file_manager.track_file(job['output_path'], self.output_retention)
+            file_manager.update_progress(job_id, 'done')
+            logger.info(f"Render job {job_id} served from the render cache")
+            return job_id
+
+        with self._jobs_lock:
+            self.jobs[job_id] = job
+            self._payloads[job_id] = (timeline, target_resolution, background_audio, render_mode, profile, preview)
+
+        FileManager.get_instance().update_progress(job_id, 'queued')
+        self._ensure_started()
+        self._queue.put((priority, next(self._sequence), job_id))
+        logger.info(f"Queued render job {job_id} with priority {priority}")
+        return job_id
+
+    def get_job(self, job_id):
+        """Return a snapshot of the job record, or None if unknown."""
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def release_output(self, job_id):
+        """Delete a finished job's output, and forget the job, before its retention period ends."""
+        job = self.get_job(job_id)
+        if job and job['status'] in ('done', 'failed'):
+            self._forget(job_id)
+        return job is not None
+
+    def prune_jobs(self):
+        """Forget jobs that finished longer than the retention period ago."""
+        cutoff = datetime.now() - self.output_retention
+        with self._jobs_lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] <= cutoff]
+        for job_id in expired:
+            self._forget(job_id)
+
+    def _forget(self, job_id):
+        """Drop a finished job's record, progress, output and directory."""
+        with self._jobs_lock:
+            job = self.jobs.pop(job_id, None)
+        if job is None:
+            return
+        file_manager = FileManager.get_instance()
+        file_manager.remove_file(job['output_path'])
+        file_manager.clear_progress(job_id)
+        shutil.rmtree(os.path.dirname(job['output_path']), ignore_errors=True)
+        logger.debug(f"Forgot render job {job_id}")
+
+    def queue_position(self, job_id):
+        """Number of queued jobs that will be dispatched before this one."""
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] != 'queued':
+                return 0
+            key = (job['priority'], job['created_at'])
+            return sum(1 for other in self.jobs.values()
+                       if other['status'] == 'queued' and (other['priority'], other['created_at']) < key)
+
+    def _ensure_started(self):
+        with self._lock:
+            # Spawned workers avoid inheriting the Flask server's threads and sockets
+            context = multiprocessing.get_context('spawn')
+            if self._progress_queue is None:
+                self._progress_queue = context.Queue()
+                self._progress_listener = threading.Thread(target=self._progress_loop, name='render-progress', daemon=True)
+                self._progress_listener.start()
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                     initializer=_init_worker, initargs=(self._progress_queue,))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name='render-dispatcher', daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        """Hand queued jobs to the pool in priority order, one per free worker."""
+        while True:
+            # Wait for a free worker before taking a job, so a job submitted meanwhile can still overtake
+            self._slots.acquire()
+            _, _, job_id = self._queue.get()
+            with self._jobs_lock:
+                payload = self._payloads.pop(job_id, None)
+                job = self.jobs.get(job_id)
+                if job is None or payload is None:
+                    self._slots.release()
+                    continue
+                job['status'] = 'running'
+                job['started_at'] = datetime.now()
+                output_path = job['output_path']
+
+            try:
+                self._ensure_started()
+                future = self._executor.submit(_render_job, job_id, payload[0], output_path, *payload[1:])
+            except Exception as e:
+                logger.error(f"Failed to dispatch render job {job_id}: {str(e)}")
+                self._finish(job_id, error=e)
+                continue
+            future.add_done_callback(partial(self._on_job_done, job_id))
+            logger.info(f"Dispatched render job {job_id}")
+
+    def _progress_loop(self):
+        """Relay progress reported by worker processes into the FileManager."""
+        file_manager = FileManager.get_instance()
+        while True:
+            try:
+                job_id, stage, current, total = self._progress_queue.get()
+                file_manager.update_progress(job_id, stage, current, total)
+            except Exception as e:
+                logger.warning(f"Failed to relay render progress: {str(e)}")
+
+    def _on_job_done(self, job_id, future):
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # A worker died (e.g. OOM); start a fresh pool for the next job
+            with self._lock:
+                self._executor = None
+        self._finish(job_id, error=error)
+
+    def _finish(self, job_id, error=None):
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            if job:
+                job['finished_at'] = datetime.now()
+                if error is None:
+                    job['status'] = 'done'
+                else:
+                    job['status'] = 'failed'
+                    job['error'] = str(error) or error.__class__.__name__
+        file_manager = FileManager.get_instance()
+        if error is None and job:
+            # Outputs stay downloadable (and seekable) until the retention period ends
+            file_manager.track_file(job['output_path'], self.output_retention)
+            try:
+                RenderCache.get_instance().store(job['cache_key'], job['output_path'])
+            except Exception as e:
+                logger.warning(f"Failed to cache render job {job_id}: {str(e)}")
+        file_manager.update_progress(job_id, 'done' if error is None else 'failed')
+        self._slots.release()
+        self.prune_jobs()
+        if error is None:
+            logger.info(f"Render job {job_id} finished")
+        else:
+            logger.error(f"Render job {job_id} failed: {str(error)}")
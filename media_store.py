@@ -0,0 +1,215 @@
+import os
+import re
+import glob
+import json
+import uuid
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+from threading import Lock
+from file_manager import FileManager
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MEDIA_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadOffsetError(ValueError):
+    """A chunk was sent for an offset other than the next expected byte."""
+
+    def __init__(self, expected_offset):
+        super().__init__(f"Expected chunk at offset {expected_offset}")
+        self.expected_offset = expected_offset
+
+
+class MediaStore:
+    """Uploaded media stored once on disk, keyed by the SHA-256 of its content."""
+    _instance = None
+    _lock = Lock()
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_folder = os.path.join(root, 'tmp')
+        self.upload_folder = os.path.join(root, 'uploads')
+        self._upload_locks = {}
+        os.makedirs(self.tmp_folder, exist_ok=True)
+        os.makedirs(self.upload_folder, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    root = os.environ.get('MEDIA_STORE', os.path.join(tempfile.gettempdir(), 'media_store'))
+                    cls._instance = cls(root)
+        return cls._instance
+
+    @staticmethod
+    def is_valid_id(media_id):
+        return isinstance(media_id, str) and bool(MEDIA_ID_PATTERN.match(media_id))
+
+    def _final_path(self, media_id, extension):
+        return os.path.join(self.root, media_id[:2], media_id + extension)
+
+    def save_stream(self, stream, extension):
+        """Copy a file-like object into the store and return its media id."""
+        digest = hashlib.sha256()
+        temp_path = os.path.join(self.tmp_folder, uuid.uuid4().hex)
+        try:
+            with open(temp_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._commit(temp_path, digest.hexdigest(), extension)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def save_bytes(self, data, extension):
+        """Store an in-memory payload and return its media id."""
+        media_id = hashlib.sha256(data).hexdigest()
+        temp_path = os.path.join(self.tmp_folder, uuid.uuid4().hex)
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            return self._commit(temp_path, media_id, extension)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _commit(self, temp_path, media_id, extension):
+        """Move a fully written temp file to its content-addressed location."""
+        extension = extension.lower()
+        existing = self.get_path(media_id)
+        if existing:
+            logger.debug(f"Media {media_id} already stored, discarding duplicate upload")
+            FileManager.get_instance().track_file(existing)
+            return media_id
+
+        final_path = self._final_path(media_id, extension)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        FileManager.get_instance().track_file(final_path)
+        logger.info(f"Stored media {media_id}{extension}")
+        return media_id
+
+    def get_path(self, media_id):
+        """Return the on-disk path of a stored media id, or None."""
+        if not self.is_valid_id(media_id):
+            return None
+        matches = glob.glob(os.path.join(self.root, media_id[:2], media_id + '.*'))
+        return matches[0] if matches else None
+
+    # Chunked uploads: a session is a JSON description plus a growing .part file
+
+    def _upload_paths(self, upload_id):
+        if not isinstance(upload_id, str) or not UPLOAD_ID_PATTERN.match(upload_id):
+            raise LookupError('Unknown upload')
+        base = os.path.join(self.upload_folder, upload_id)
+        if not os.path.exists(base + '.json'):
+            raise LookupError('Unknown upload')
+        return base + '.json', base + '.part'
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            if upload_id not in self._upload_locks:
+                self._prune_upload_locks()
+            return self._upload_locks.setdefault(upload_id, Lock())
+
+    def _prune_upload_locks(self):
+        """Drop the locks of sessions whose files have expired."""
+        for upload_id, lock in list(self._upload_locks.items()):
+            if not lock.locked() and not os.path.exists(os.path.join(self.upload_folder, upload_id + '.json')):
+                del self._upload_locks[upload_id]
+
+    def begin_upload(self, filename, size, sha256=None):
+        """Start a chunked upload session and return its id."""
+        if sha256 is not None and not self.is_valid_id(sha256.lower() if isinstance(sha256, str) else sha256):
+            raise ValueError('sha256 must be a hex SHA-256 digest')
+        upload_id = uuid.uuid4().hex
+        base = os.path.join(self.upload_folder, upload_id)
+        session = {
+            'filename': filename,
+            'extension': os.path.splitext(filename)[1].lower(),
+            'size': int(size),
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': datetime.now().isoformat()
+        }
+        open(base + '.part', 'wb').close()
+        with open(base + '.json', 'w') as f:
+            json.dump(session, f)
+
+        file_manager = FileManager.get_instance()
+        file_manager.track_file(base + '.part')
+        file_manager.track_file(base + '.json')
+        logger.info(f"Started chunked upload {upload_id} for {filename} ({size} bytes)")
+        return upload_id
+
+    def get_upload(self, upload_id):
+        """Return the session description with the number of bytes received."""
+        meta_path, part_path = self._upload_paths(upload_id)
+        with open(meta_path) as f:
+            session = json.load(f)
+        session['upload_id'] = upload_id
+        session['offset'] = os.path.getsize(part_path)
+        return session
+
+    def write_chunk(self, upload_id, offset, stream):
+        """Append a chunk read from stream at offset and return the new offset."""
+        meta_path, part_path = self._upload_paths(upload_id)
+        lock = self._upload_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadOffsetError(os.path.getsize(part_path))
+        try:
+            session = self.get_upload(upload_id)
+            if offset != session['offset']:
+                raise UploadOffsetError(session['offset'])
+
+            written = offset
+            with open(part_path, 'ab') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > session['size']:
+                        raise ValueError('Chunk exceeds declared upload size')
+                    f.write(chunk)
+            return written
+        finally:
+            lock.release()
+
+    def finalize_upload(self, upload_id):
+        """Verify a completed upload and move it into the store."""
+        meta_path, part_path = self._upload_paths(upload_id)
+        lock = self._upload_lock(upload_id)
+        with lock:
+            session = self.get_upload(upload_id)
+            if session['offset'] != session['size']:
+                raise UploadOffsetError(session['offset'])
+
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            media_id = digest.hexdigest()
+            if session['sha256'] and session['sha256'] != media_id:
+                raise ValueError('Uploaded content does not match the declared SHA-256')
+
+            try:
+                self._commit(part_path, media_id, session['extension'])
+            finally:
+                for path in (part_path, meta_path):
+                    if os.path.exists(path):
+                        os.unlink(path)
+                with self._lock:
+                    self._upload_locks.pop(upload_id, None)
+
+        logger.info(f"Finalized chunked upload {upload_id} as media {media_id}")
+        return media_id, session
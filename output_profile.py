@@ -0,0 +1,155 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+FPS_POLICIES = ('fixed', 'max')
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+                'medium', 'slow', 'slower', 'veryslow')
+# Container -> (video codec, audio codec)
+CONTAINERS = {
+    'mp4': ('libx264', 'aac'),
+    'mov': ('libx264', 'aac'),
+    'mkv': ('libx264', 'aac')
+}
+# Settings a request may override
+PROFILE_SETTINGS = ('fps', 'fps_policy', 'max_fps', 'preset', 'crf', 'bitrate', 'audio_bitrate',
+                    'threads', 'container', 'faststart', 'filter_workers', 'filter_batch')
+
+
+class OutputProfile:
+    """Encoder settings for a render.
+
+    fps_policy 'max' follows the fastest source, falling back to fps when no source has a frame rate.
+    """
+
+    def __init__(self, name='custom', fps=24, fps_policy='fixed', max_fps=60, preset='medium', crf=23,
+                 bitrate=None, audio_bitrate=None, threads=None, container='mp4',
+                 faststart=False, filter_workers=None, filter_batch=8):
+        if fps_policy not in FPS_POLICIES:
+            raise ValueError(f"fps_policy must be one of {', '.join(FPS_POLICIES)}")
+        if preset not in X264_PRESETS:
+            raise ValueError(f"preset must be one of {', '.join(X264_PRESETS)}")
+        if container not in CONTAINERS:
+            raise ValueError(f"container must be one of {', '.join(CONTAINERS)}")
+        if float(fps) <= 0:
+            raise ValueError('fps must be positive')
+        if crf is not None and not 0 <= int(crf) <= 51:
+            raise ValueError('crf must be between 0 and 51')
+        if filter_workers is not None and int(filter_workers) < 1:
+            raise ValueError('filter_workers must be at least 1')
+        if int(filter_batch) < 1:
+            raise ValueError('filter_batch must be at least 1')
+
+        self.name = name
+        self.fps = float(fps)
+        self.fps_policy = fps_policy
+        self.max_fps = float(max_fps)
+        self.preset = preset
+        # A target bitrate replaces the constant rate factor
+        self.crf = None if bitrate else (int(crf) if crf is not None else None)
+        self.bitrate = bitrate
+        self.audio_bitrate = audio_bitrate
+        self.threads = int(threads) if threads else (os.cpu_count() or 1)
+        self.container = container
+        self.faststart = faststart
+        self.filter_workers = int(filter_workers) if filter_workers else (os.cpu_count() or 1)
+        self.filter_batch = int(filter_batch)
+
+    @classmethod
+    def from_request(cls, data):
+        """Build a profile from a preset name or a dict of overrides.
+
+        A dict may name the preset it starts from with 'name'.
+        """
+        if data is None:
+            return cls.named(DEFAULT_PROFILE)
+        if isinstance(data, str):
+            return cls.named(data)
+        if not isinstance(data, dict):
+            raise ValueError('profile must be a preset name or an object')
+
+        name = data.get('name', DEFAULT_PROFILE)
+        if name not in PRESETS:
+            raise ValueError(f"Unknown profile '{name}'")
+        settings = dict(PRESETS[name])
+
+        overrides = {key: value for key, value in data.items() if key != 'name'}
+        unknown = set(overrides) - set(PROFILE_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown profile settings: {', '.join(sorted(unknown))}")
+        if 'fps' in overrides and 'fps_policy' not in overrides:
+            overrides['fps_policy'] = 'fixed'
+        settings.update(overrides)
+        return cls(name=name, **settings)
+
+    @classmethod
+    def named(cls, name):
+        if name not in PRESETS:
+            raise ValueError(f"Unknown profile '{name}'")
+        return cls(name=name, **PRESETS[name])
+
+    @property
+    def extension(self):
+        return '.' + self.container
+
+    @property
+    def video_codec(self):
+        return CONTAINERS[self.container][0]
+
+    @property
+    def audio_codec(self):
+        return CONTAINERS[self.container][1]
+
+    def resolve_fps(self, clips):
+        """Frame rate to encode at for the given source clips."""
+        if self.fps_policy == 'max':
+            rates = [clip.fps for clip in clips if getattr(clip, 'fps', None)]
+            if rates:
+                return min(max(rates), self.max_fps)
+        return self.fps
+
+    def ffmpeg_params(self):
+        # MoviePy picks the pixel format itself (yuv420p for libx264 at even sizes)
+        params = []
+        if self.crf is not None:
+            params += ['-crf', str(self.crf)]
+        if self.faststart and self.container in ('mp4', 'mov'):
+            params += ['-movflags', '+faststart']
+        return params
+
+    def write_kwargs(self, fps):
+        """Keyword arguments for VideoClip.write_videofile."""
+        return {
+            'codec': self.video_codec,
+            'audio_codec': self.audio_codec,
+            'fps': fps,
+            'preset': self.preset,
+            'bitrate': self.bitrate,
+            'audio_bitrate': self.audio_bitrate,
+            'threads': self.threads,
+            'ffmpeg_params': self.ffmpeg_params()
+        }
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'fps': self.fps,
+            'fps_policy': self.fps_policy,
+            'preset': self.preset,
+            'crf': self.crf,
+            'bitrate': self.bitrate,
+            'threads': self.threads,
+            'container': self.container,
+            'filter_workers': self.filter_workers,
+            'filter_batch': self.filter_batch
+        }
+
+
+# 'draft' trades quality for speed so previews render several times faster
+PRESETS = {
+    'draft': {'fps': 15, 'fps_policy': 'fixed', 'preset': 'ultrafast', 'crf': 32},
+    'web': {'fps': 24, 'fps_policy': 'max', 'max_fps': 30, 'preset': 'medium', 'crf': 23, 'faststart': True},
+    'archive': {'fps': 24, 'fps_policy': 'max', 'max_fps': 60, 'preset': 'slow', 'crf': 17}
+}
+DEFAULT_PROFILE = 'web'
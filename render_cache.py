@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+from file_manager import FileManager
+from filters import FILTERS, item_filters
+from output_profile import PROFILE_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Renderer defaults, so an omitted setting hashes like its default
+ITEM_DEFAULTS = {
+    'duration': 5.0,
+    'keepAudio': False,
+    'startTransition': 'fade-in',
+    'endTransition': 'fade-out',
+    'nextTransition': 'none',
+    'fit': 'contain',
+    'interpolation': None,
+    'transitionOptions': {}
+}
+# Item fields that don't affect the output; media are hashed by content instead
+IGNORED_ITEM_FIELDS = ('filename', 'filepath', 'media_id', 'mime_type', 'filter', 'filters')
+# Profile settings that change how fast a render runs but not its output
+IGNORED_PROFILE_SETTINGS = ('filter_workers', 'filter_batch')
+
+
+def _media_key(path):
+    """A stored media file's name: its content hash plus the extension it is decoded by."""
+    return os.path.basename(path) if path else None
+
+
+def canonical_item(item):
+    """The settings of a resolved timeline item that affect its rendered frames and audio."""
+    canonical = dict(ITEM_DEFAULTS)
+    canonical.update({key: value for key, value in item.items() if key not in IGNORED_ITEM_FIELDS})
+    canonical['duration'] = float(canonical['duration'])
+    canonical['keepAudio'] = bool(canonical['keepAudio'])
+    canonical['transitionOptions'] = canonical['transitionOptions'] or {}
+    canonical['media'] = _media_key(item.get('filepath'))
+    canonical['filters'] = [[name, FILTERS[name].settings(params)] for name, params in item_filters(item)]
+    return canonical
+
+
+def _profile_settings(profile):
+    return {key: getattr(profile, key) for key in PROFILE_SETTINGS
+            if key not in IGNORED_PROFILE_SETTINGS} if profile else None
+
+
+def _digest(settings):
+    encoded = json.dumps(settings, sort_keys=True, separators=(',', ':'), default=list)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def render_key(timeline, target_resolution=None, background_audio=None, render_mode='composite', profile=None,
+               preview=None):
+    """SHA-256 of everything that determines a render's output, in a canonical form."""
+    return _digest({
+        'timeline': [canonical_item(item) for item in timeline],
+        'resolution': list(target_resolution) if target_resolution else None,
+        'background_audio': _media_key(background_audio),
+        'render_mode': render_mode,
+        'profile': _profile_settings(profile),
+        'preview': preview
+    })
+
+
+def segment_key(items, crossfades, target_size, fps, profile):
+    """SHA-256 of everything that determines a video-only segment of segments mode."""
+    return _digest({
+        'items': [canonical_item(item) for item in items],
+        'crossfades': crossfades,
+        'size': list(target_size),
+        'fps': fps,
+        'profile': _profile_settings(profile)
+    })
+
+
+class RenderCache:
+    """Finished renders kept on disk by render_key, so an unchanged timeline isn't rendered again.
+
+    Bounded by a byte budget with LRU eviction; unused entries also expire through the FileManager.
+    """
+    _instance = None
+    _lock = Lock()
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self._entries_lock = Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    root = os.environ.get('RENDER_CACHE', os.path.join(tempfile.gettempdir(), 'render_cache'))
+                    cls._instance = cls(root, int(os.environ.get('RENDER_CACHE_MB', 2048)) * 1024 * 1024)
+        return cls._instance
+
+    def _load(self):
+        """Index renders cached by an earlier run, least recently used first."""
+        paths = [os.path.join(self.root, name) for name in os.listdir(self.root)]
+        paths = sorted((path for path in paths if os.path.isfile(path)), key=os.path.getmtime)
+        file_manager = FileManager.get_instance()
+        for path in paths:
+            key = os.path.splitext(os.path.basename(path))[0]
+            size = os.path.getsize(path)
+            self.entries[key] = (path, size)
+            self.size += size
+            file_manager.track_file(path)
+        self._evict()
+
+    def _evict(self):
+        # Entries the FileManager expired are gone from disk already
+        for key, (path, size) in list(self.entries.items()):
+            if not os.path.exists(path):
+                del self.entries[key]
+                self.size -= size
+        file_manager = FileManager.get_instance()
+        while self.size > self.max_bytes and self.entries:
+            key, (path, size) = self.entries.popitem(last=False)
+            self.size -= size
+            file_manager.remove_file(path)
+            logger.debug(f"Evicted cached render {key}")
+
+    def fetch(self, key, output_path):
+        """Place the render cached under key at output_path; returns False on a miss."""
+        with self._entries_lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False
+            path, size = entry
+            if not os.path.exists(path):
+                # Expired and removed by the FileManager
+                del self.entries[key]
+                self.size -= size
+                return False
+            self.entries.move_to_end(key)
+            _link(path, output_path)
+            os.utime(path)
+        FileManager.get_instance().track_file(path)
+        logger.info(f"Render cache hit for {key}")
+        return True
+
+    def store(self, key, output_path):
+        """Keep a finished render under key."""
+        size = os.path.getsize(output_path)
+        if size > self.max_bytes:
+            return
+        path = os.path.join(self.root, key + os.path.splitext(output_path)[1])
+        with self._entries_lock:
+            if key in self.entries:
+                return
+            _link(output_path, path)
+            self.entries[key] = (path, size)
+            self.size += size
+            FileManager.get_instance().track_file(path)
+            self._evict()
+        logger.info(f"Cached render {key} ({size} bytes)")
+
+
+class SegmentCache:
+    """Encoded segments of segments mode, so a re-render only encodes the items that changed.
+
+    Each worker process has its own instance, so the directory is the index:
+    <key>.json, written last, marks a segment complete and mtimes order eviction.
+    """
+    _instance = None
+    _lock = Lock()
+
+    def __init__(self, root, max_bytes, expiry):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    root = os.environ.get('SEGMENT_CACHE', os.path.join(tempfile.gettempdir(), 'segment_cache'))
+                    max_bytes = int(os.environ.get('SEGMENT_CACHE_MB', 4096)) * 1024 * 1024
+                    cls._instance = cls(root, max_bytes, FileManager.get_instance().file_expiry)
+        return cls._instance
+
+    def _paths(self, key, extension):
+        base = os.path.join(self.root, key)
+        return base + extension, base + '.json'
+
+    def fetch(self, key, segment_path):
+        """Place the segment cached under key at segment_path; returns its (duration, starts) or None."""
+        path, meta_path = self._paths(key, os.path.splitext(segment_path)[1])
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            _link(path, segment_path)
+            os.utime(path)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return meta['duration'], meta['starts']
+
+    def store(self, key, segment_path, duration, starts):
+        """Keep an encoded segment under key."""
+        path, meta_path = self._paths(key, os.path.splitext(segment_path)[1])
+        _link(segment_path, path)
+        temp_path = f"{meta_path}.{os.getpid()}"
+        with open(temp_path, 'w') as f:
+            json.dump({'duration': duration, 'starts': starts}, f)
+        os.replace(temp_path, meta_path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.json') or not os.path.isfile(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                continue
+
+        expired_before = time.time() - self.expiry.total_seconds()
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_bytes and mtime >= expired_before:
+                break
+            size -= entry_size
+            for stale in (os.path.splitext(path)[0] + '.json', path):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            logger.debug(f"Evicted cached segment {os.path.basename(path)}")
+
+
+def _link(source, destination):
+    """Hard link source to destination, copying if the two are on different file systems."""
+    temp_path = f"{destination}.{os.getpid()}.tmp"
+    try:
+        os.link(source, temp_path)
+    except OSError as e:
+        if not os.path.exists(source):
+            raise e
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
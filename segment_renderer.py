@@ -0,0 +1,275 @@
+import os
+import copy
+import logging
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import moviepy.editor as mp
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from utils import (load_clip, build_item_clip, get_max_resolution, mix_background_audio, link_crossfades,
+                   layout_clips, SequentialTimelineClip, is_still, transition_frames, probe_media, LazyAudioClip,
+                   TimelineAudioClip)
+from output_profile import OutputProfile, DEFAULT_PROFILE
+from render_cache import SegmentCache, segment_key
+from frame_cache import FrameCache
+
+logger = logging.getLogger(__name__)
+
+
+def _init_segment_worker(frame_cache_bytes):
+    FrameCache._instance = FrameCache(frame_cache_bytes)
+
+
+def segment_frame_count(duration, fps):
+    """Number of frames MoviePy writes for a clip of this duration."""
+    return len(np.arange(0, duration, 1.0 / fps))
+
+
+def render_segment(items, crossfades, target_size, segment_path, profile, fps):
+    """Encode timeline items as one video-only segment; runs in a worker process.
+
+    Returns the duration as encoded (a whole number of frames) and the start of each item in it.
+    """
+    clips = []
+    built = []
+    processed = None
+    try:
+        for item in items:
+            clips.append(load_clip(item))
+            built.append(build_item_clip(item, clips[-1], *target_size, profile=profile))
+        placed = layout_clips(built, crossfades)
+        if len(placed) == 1:
+            processed = placed[0]
+        else:
+            processed = SequentialTimelineClip(placed, target_size, sources=clips, crossfades=crossfades)
+        times = np.arange(0, processed.duration, 1.0 / fps)
+        if len(items) == 1 and is_still(items[0], clips[0]):
+            head, tail = transition_frames(items[0], times)
+            # Below a second of unchanging frames the extra encoder runs cost more than they save
+            if len(times) - head - tail >= fps:
+                write_still_segment(processed, times, head, tail, target_size, segment_path, profile, fps)
+                return len(times) / fps, [0]
+
+        write_kwargs = profile.write_kwargs(fps)
+        del write_kwargs['audio_codec'], write_kwargs['audio_bitrate']
+        processed.write_videofile(segment_path, audio=False, logger=None, **write_kwargs)
+        return segment_frame_count(processed.duration, fps) / fps, [clip.start for clip in placed]
+    finally:
+        for c in [processed] + built + clips:
+            try:
+                if c is not None:
+                    c.close()
+            except Exception:
+                pass
+
+
+def write_still_segment(clip, times, head, tail, target_size, segment_path, profile, fps):
+    """Encode the segment of a still image, feeding the encoder its unchanging frame once.
+
+    Only the head and tail frames, where the transitions run, are rendered; ffmpeg loops the frame between.
+    """
+    base = os.path.splitext(segment_path)[0]
+    kwargs = profile.write_kwargs(fps)
+    encoder = {key: kwargs[key] for key in ('codec', 'preset', 'bitrate', 'threads', 'ffmpeg_params')}
+    parts = []
+
+    def write_frames(name, part_times):
+        if not len(part_times):
+            return
+        path = f'{base}_{name}{profile.extension}'
+        writer = FFMPEG_VideoWriter(path, target_size, fps, **encoder)
+        try:
+            for t in part_times:
+                writer.write_frame(clip.get_frame(t).astype('uint8'))
+        finally:
+            writer.close()
+        parts.append(path)
+
+    write_frames('head', times[:head])
+
+    still_path = f'{base}_still.png'
+    cv2.imwrite(still_path, cv2.cvtColor(clip.get_frame(times[head]).astype('uint8'), cv2.COLOR_RGB2BGR))
+    # Output options in the order FFMPEG_VideoWriter passes them
+    args = ['-loop', '1', '-framerate', '%.02f' % fps, '-i', still_path, '-frames:v', str(len(times) - head - tail),
+            '-vcodec', encoder['codec'], '-preset', encoder['preset']] + encoder['ffmpeg_params']
+    if encoder['bitrate']:
+        args += ['-b', encoder['bitrate']]
+    args += ['-threads', str(encoder['threads'])]
+    if encoder['codec'] == 'libx264' and target_size[0] % 2 == 0 and target_size[1] % 2 == 0:
+        args += ['-pix_fmt', 'yuv420p']
+    parts.append(f'{base}_still{profile.extension}')
+    run_ffmpeg(args + [parts[-1]])
+
+    write_frames('tail', times[len(times) - tail:])
+    concat_segments(parts, segment_path)
+
+
+def run_ffmpeg(args):
+    """Run ffmpeg with the binary MoviePy is configured to use."""
+    cmd = [get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error'] + args
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+
+def concat_segments(segment_paths, output_path):
+    """Join segments losslessly with ffmpeg's concat demuxer."""
+    list_path = os.path.splitext(output_path)[0] + '.txt'
+    with open(list_path, 'w') as f:
+        for path in segment_paths:
+            f.write(f"file '{path}'\n")
+    run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path])
+
+
+def build_timeline_audio(timeline, offsets, total_duration, background_audio=None):
+    """Mix item audio (placed at the item offsets) with the background once.
+
+    Returns the audio clip and the clips that must be closed afterwards.
+    """
+    opened = []
+    tracks = []
+    for item, offset in zip(timeline, offsets):
+        path = item.get('filepath', '')
+        if not item.get('keepAudio') or path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+            continue
+        try:
+            info = probe_media(path)
+        except Exception:
+            continue
+        if not info['has_audio']:
+            # Videos without an audio stream
+            continue
+        audio = LazyAudioClip(path, info['duration'])
+        opened.append(audio)
+        tracks.append(audio.set_start(offset))
+
+    audio = TimelineAudioClip(tracks).set_duration(total_duration) if tracks else None
+
+    if background_audio:
+        try:
+            background_audio_clip = mp.AudioFileClip(background_audio)
+            opened.append(background_audio_clip)
+            audio = mix_background_audio(audio, background_audio_clip, total_duration)
+        except Exception as e:
+            logger.error(f"Failed to load background audio: {str(e)}")
+
+    return audio, opened
+
+
+def render_segments(timeline, output_path, target_resolution=None, background_audio=None,
+                    progress_callback=None, workers=None, profile=None):
+    """Render each timeline item as its own cached segment in parallel, then join them.
+
+    Items joined by a crossfade share a segment; the audio is mixed once and muxed in.
+    """
+    profile = profile or OutputProfile.named(DEFAULT_PROFILE)
+    timeline, crossfades = link_crossfades(timeline)
+    groups = []
+    for idx in range(len(timeline)):
+        if idx and crossfades[idx - 1]:
+            groups[-1].append(idx)
+        else:
+            groups.append([idx])
+
+    def report(stage, current, total):
+        if progress_callback:
+            try:
+                progress_callback(stage, current, total)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {str(e)}")
+
+    if target_resolution and profile.fps_policy == 'fixed':
+        target_size = tuple(target_resolution)
+        fps = profile.fps
+    else:
+        # Only the sizes and frame rates are needed here, so each clip is closed right away
+        clips = []
+        try:
+            for idx, item in enumerate(timeline):
+                report('decode', idx, len(timeline))
+                clips.append(load_clip(item))
+            fps = profile.resolve_fps(clips)
+            if target_resolution:
+                target_size = tuple(target_resolution)
+            else:
+                target_size = get_max_resolution(clips)
+                logger.info(f"Using max resolution from media: {target_size[0]}x{target_size[1]}")
+        finally:
+            for clip in clips:
+                clip.close()
+
+    workers = workers or int(os.environ.get('SEGMENT_WORKERS', 0)) or os.cpu_count() or 1
+    # Segments already run in parallel, so they share the threads and frame cache; keys still use profile
+    concurrent = max(1, min(workers, len(groups)))
+    segment_profile = copy.copy(profile)
+    segment_profile.filter_workers = max(1, profile.filter_workers // concurrent)
+    segment_profile.threads = max(1, profile.threads // concurrent)
+    frame_cache_bytes = FrameCache.get_instance().max_bytes // concurrent
+    segment_cache = SegmentCache.get_instance()
+    with tempfile.TemporaryDirectory() as work_dir:
+        segment_paths = [os.path.join(work_dir, f'segment_{idx:04d}.mp4') for idx in range(len(groups))]
+        durations = [None] * len(groups)
+        item_starts = [None] * len(groups)
+
+        keys = [segment_key([timeline[i] for i in group], [crossfades[i] for i in group], target_size, fps, profile)
+                for group in groups]
+        pending = []
+        for idx, (key, path) in enumerate(zip(keys, segment_paths)):
+            cached = segment_cache.fetch(key, path)
+            if cached:
+                durations[idx], item_starts[idx] = cached
+            else:
+                pending.append(idx)
+        logger.info(f"Reusing {len(groups) - len(pending)} of {len(groups)} cached segments")
+
+        # Mixing the audio and joining the segments is the last step of the encode stage
+        steps = len(pending) + 1
+        report('encode', 0, steps)
+        if pending:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context,
+                                     initializer=_init_segment_worker, initargs=(frame_cache_bytes,)) as executor:
+                futures = {executor.submit(render_segment, [timeline[i] for i in groups[idx]],
+                                           [crossfades[i] for i in groups[idx]], target_size, segment_paths[idx],
+                                           segment_profile, fps): idx
+                           for idx in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    idx = futures[future]
+                    durations[idx], item_starts[idx] = future.result()
+                    try:
+                        segment_cache.store(keys[idx], segment_paths[idx], durations[idx], item_starts[idx])
+                    except Exception as e:
+                        logger.warning(f"Failed to cache segment {idx}: {str(e)}")
+                    report('encode', done, steps)
+
+        segment_offsets = np.concatenate([[0], np.cumsum(durations)[:-1]]).tolist()
+        offsets = [offset + start for offset, starts in zip(segment_offsets, item_starts) for start in starts]
+        total_duration = float(sum(durations))
+
+        mux_params = ['-movflags', '+faststart'] if profile.faststart and profile.container in ('mp4', 'mov') else []
+        audio, opened = build_timeline_audio(timeline, offsets, total_duration, background_audio)
+        try:
+            video_path = os.path.join(work_dir, 'video' + profile.extension)
+            concat_segments(segment_paths, video_path)
+            if audio is None:
+                run_ffmpeg(['-i', video_path, '-c', 'copy'] + mux_params + [output_path])
+            else:
+                audio_path = os.path.join(work_dir, 'audio.m4a')
+                audio_kwargs = {'bitrate': profile.audio_bitrate} if profile.audio_bitrate else {}
+                audio.write_audiofile(audio_path, fps=44100, codec=profile.audio_codec, logger=None, **audio_kwargs)
+                run_ffmpeg(['-i', video_path, '-i', audio_path, '-map', '0:v', '-map', '1:a',
+                            '-c', 'copy', '-shortest'] + mux_params + [output_path])
+            report('encode', steps, steps)
+        finally:
+            for clip in opened:
+                try:
+                    clip.close()
+                except Exception:
+                    pass
+
+    logger.info(f"Rendered {len(pending)} of {len(groups)} segments with {workers} workers into {output_path}")
+    return True
@@ -2,9 +2,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const dropZone = document.getElementById('drop-zone');
     const fileInput = document.getElementById('file-input');
     const exportBtn = document.getElementById('export-btn');
+    const previewBtn = document.getElementById('preview-btn');
     const useCustomResolution = document.getElementById('use-custom-resolution');
     const resolutionControls = document.getElementById('resolution-controls');
-    const MAX_FILE_SIZE = 16 * 1024 * 1024; // 16MB
+    const MAX_FILE_SIZE = 8 * 1024 * 1024 * 1024; // 8GB, uploaded in chunks
+    const CHUNK_RETRIES = 3;
 
     // Initialize timeline manager with AI-generated timeline
     window.timelineManager = {
@@ -35,7 +37,15 @@ document.addEventListener('DOMContentLoaded', function() {
         },
 
         calculateTotalDuration: function() {
-            return this.items.reduce((total, item) => total + parseFloat(item.duration || 0), 0);
+            return this.items.reduce((total, item, index) => {
+                total += parseFloat(item.duration || 0);
+                // A crossfade overlaps the next item by up to a second
+                const next = this.items[index + 1];
+                if (next && item.nextTransition && item.nextTransition !== 'none') {
+                    total -= Math.min(1, parseFloat(item.duration || 0) / 2, parseFloat(next.duration || 0) / 2);
+                }
+                return total;
+            }, 0);
         },
 
         getNextTimelineItem: function() {
@@ -75,6 +85,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     exportBtn.addEventListener('click', exportVideo);
+    previewBtn.addEventListener('click', previewVideo);
 
     // Listen for timeline updates
     document.addEventListener('timelineUpdated', (e) => {
@@ -83,7 +94,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     function validateFile(file) {
         if (file.size > MAX_FILE_SIZE) {
-            throw new Error(`File ${file.name} is too large. Maximum size is 64MB`);
+            throw new Error(`File ${file.name} is too large. Maximum size is 8GB`);
         }
         const allowedTypes = ['image/jpeg', 'image/png', 'image/gif', 'video/mp4'];
         if (!allowedTypes.includes(file.type)) {
@@ -103,15 +114,77 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function uploadFile(file) {
-        const formData = new FormData();
-        formData.append('file', file);
+    async function postJson(url, body) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: body ? JSON.stringify(body) : undefined
+        });
+        return response;
+    }
+
+    async function startOrResumeUpload(file) {
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            const response = await fetch(`/uploads/${savedId}`);
+            if (response.ok) {
+                const status = await response.json();
+                return { resumeKey, uploadId: savedId, offset: status.offset, chunkSize: status.chunk_size };
+            }
+            localStorage.removeItem(resumeKey);
+        }
+
+        const response = await postJson('/uploads', { filename: file.name, size: file.size });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+        localStorage.setItem(resumeKey, data.upload_id);
+        return { resumeKey, uploadId: data.upload_id, offset: data.offset, chunkSize: data.chunk_size };
+    }
+
+    async function uploadInChunks(file) {
+        let { resumeKey, uploadId, offset, chunkSize } = await startOrResumeUpload(file);
+        let failures = 0;
 
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + chunkSize);
+            try {
+                const response = await fetch(`/uploads/${uploadId}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream'
+                    },
+                    body: chunk
+                });
+                const data = await response.json();
+                if (response.ok || response.status === 409) {
+                    // On 409 the server tells us where to continue from
+                    offset = data.offset;
+                    failures = 0;
+                    continue;
+                }
+                throw new Error(data.error || `HTTP error! status: ${response.status}`);
+            } catch (error) {
+                if (++failures > CHUNK_RETRIES) {
+                    throw error;
+                }
+                const status = await fetch(`/uploads/${uploadId}`).then(r => r.json());
+                offset = status.offset;
+            }
+        }
+
+        const response = await postJson(`/uploads/${uploadId}/finalize`);
+        localStorage.removeItem(resumeKey);
+        return response;
+    }
+
+    async function uploadFile(file) {
         try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
+            const response = await uploadInChunks(file);
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -124,7 +197,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (timelineItem) {
                     window.timelineManager.items.push({
                         filename: data.filename,
-                        file_data: data.file_data,
+                        media_id: data.media_id,
                         duration: parseFloat(timelineItem.duration) || 5,
                         keepAudio: file.type.startsWith('video/'),
                         startTransition: timelineItem.startTransition || 'fade-in',
@@ -135,7 +208,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     // Fallback if no AI timeline item is available
                     window.timelineManager.items.push({
                         filename: data.filename,
-                        file_data: data.file_data,
+                        media_id: data.media_id,
                         duration: 5,
                         keepAudio: file.type.startsWith('video/'),
                         startTransition: 'fade-in',
@@ -228,6 +301,19 @@ document.addEventListener('DOMContentLoaded', function() {
                                 </div>
                             </div>
                         </div>
+                        ${index < window.timelineManager.items.length - 1 ? `
+                        <div class="form-group mb-3">
+                            <label>Transition to Next</label>
+                            <select class="form-control" onchange="updateNextTransition(${index}, this.value)">
+                                <option value="none" ${!item.nextTransition || item.nextTransition === 'none' ? 'selected' : ''}>None</option>
+                                <option value="crossfade" ${item.nextTransition === 'crossfade' ? 'selected' : ''}>Crossfade</option>
+                                <option value="dissolve" ${item.nextTransition === 'dissolve' ? 'selected' : ''}>Dissolve</option>
+                                <option value="wipe" ${item.nextTransition === 'wipe' ? 'selected' : ''}>Wipe</option>
+                                <option value="circle-wipe" ${item.nextTransition === 'circle-wipe' ? 'selected' : ''}>CircleWipe</option>
+                                <option value="heart" ${item.nextTransition === 'heart' ? 'selected' : ''}>Heart</option>
+                            </select>
+                        </div>
+                        ` : ''}
                         <div class="form-group mb-3">
                             <label>Filter</label>
                             <select class="form-control" onchange="updateFilter(${index}, this.value)">
@@ -295,6 +381,11 @@ document.addEventListener('DOMContentLoaded', function() {
         window.timelineManager.updateUI();
     };
 
+    window.updateNextTransition = function(index, value) {
+        window.timelineManager.items[index].nextTransition = value;
+        window.timelineManager.updateUI();
+    };
+
     window.updateFilter = function(index, value) {
         window.timelineManager.items[index].filter = value;
         window.timelineManager.updateUI();
@@ -310,72 +401,195 @@ document.addEventListener('DOMContentLoaded', function() {
         window.timelineManager.updateUI();
     };
 
-    async function exportVideo() {
+    function buildRenderRequest() {
         if (window.timelineManager.items.length === 0) {
             showAlert('Timeline is empty!', 'warning');
-            return;
+            return null;
         }
 
         const totalDuration = window.timelineManager.calculateTotalDuration();
         if (totalDuration > 300) { // 5 minutes max
             showAlert('Video duration cannot exceed 5 minutes', 'warning');
-            return;
+            return null;
         }
 
-        const exportBtn = document.getElementById('export-btn');
-        exportBtn.disabled = true;
-        exportBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Processing...';
+        const requestData = {
+            timeline: window.timelineManager.items
+        };
 
-        try {
-            const useCustomResolution = document.getElementById('use-custom-resolution').checked;
-            const requestData = {
-                timeline: window.timelineManager.items
-            };
+        const useCustomResolution = document.getElementById('use-custom-resolution').checked;
+        if (useCustomResolution) {
+            const width = parseInt(document.getElementById('width').value);
+            const height = parseInt(document.getElementById('height').value);
 
-            if (useCustomResolution) {
-                const width = parseInt(document.getElementById('width').value);
-                const height = parseInt(document.getElementById('height').value);
+            if (isNaN(width) || isNaN(height) || width < 240 || height < 240 || width > 3840 || height > 2160) {
+                showAlert('Invalid resolution values. Width: 240-3840px, Height: 240-2160px', 'warning');
+                return null;
+            }
 
-                if (isNaN(width) || isNaN(height) || width < 240 || height < 240 || width > 3840 || height > 2160) {
-                    showAlert('Invalid resolution values. Width: 240-3840px, Height: 240-2160px', 'warning');
-                    return;
-                }
+            requestData.resolution = { width, height };
+        }
 
-                requestData.resolution = { width, height };
-            }
+        return requestData;
+    }
 
-            const response = await fetch('/process', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(requestData)
-            });
+    async function startRender(requestData) {
+        const response = await fetch('/process', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(requestData)
+        });
 
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
+        const data = await response.json();
+        if (!response.ok || !data.success) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+
+        await waitForJob(data.job_id);
+        return data.job_id;
+    }
+
+    function showOutput(jobId) {
+        // The output is served with Range support, so the preview can seek without a full download
+        const preview = document.getElementById('preview');
+        preview.src = `/jobs/${jobId}/download?inline=1`;
+        preview.style.display = 'block';
+    }
+
+    async function previewVideo() {
+        const requestData = buildRenderRequest();
+        if (!requestData) return;
+
+        // A quarter-size draft of the whole timeline or of the chosen range
+        const start = parseFloat(document.getElementById('preview-start').value);
+        const end = parseFloat(document.getElementById('preview-end').value);
+        requestData.preview = {};
+        if (!isNaN(start) || !isNaN(end)) {
+            const rangeStart = isNaN(start) ? 0 : start;
+            const rangeEnd = isNaN(end) ? window.timelineManager.calculateTotalDuration() : end;
+            if (rangeEnd <= rangeStart) {
+                showAlert('Preview range end must be after its start', 'warning');
+                return;
             }
+            requestData.preview.time_range = [rangeStart, rangeEnd];
+        }
+
+        previewBtn.disabled = true;
+        previewBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Rendering...';
+        try {
+            showOutput(await startRender(requestData));
+        } catch (error) {
+            showAlert('Preview failed: ' + error, 'danger');
+        } finally {
+            showRenderProgress(null);
+            previewBtn.disabled = false;
+            previewBtn.innerHTML = 'Preview';
+        }
+    }
+
+    async function exportVideo() {
+        const requestData = buildRenderRequest();
+        if (!requestData) return;
+
+        // Previews always render composite
+        if (document.getElementById('render-segments').checked) {
+            requestData.render_mode = 'segments';
+        }
+
+        exportBtn.disabled = true;
+        exportBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Processing...';
+
+        try {
+            const jobId = await startRender(requestData);
+            showOutput(jobId);
 
-            const blob = await response.blob();
-            const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.style.display = 'none';
-            a.href = url;
-            a.download = `output_${Date.now()}.mp4`;
+            a.href = `/jobs/${jobId}/download`;
             document.body.appendChild(a);
             a.click();
-            window.URL.revokeObjectURL(url);
             document.body.removeChild(a);
 
             showAlert('Export successful!', 'success');
         } catch (error) {
             showAlert('Export failed: ' + error, 'danger');
         } finally {
+            showRenderProgress(null);
             exportBtn.disabled = false;
             exportBtn.innerHTML = 'Export Video';
         }
     }
 
+    const STAGE_LABELS = {
+        queued: 'Waiting for a free render slot',
+        decode: 'Loading media',
+        filter: 'Applying effects',
+        audio: 'Mixing audio',
+        encode: 'Encoding',
+        done: 'Done',
+        failed: 'Failed'
+    };
+
+    function showRenderProgress(progress) {
+        const container = document.getElementById('render-progress');
+        container.style.display = progress ? 'block' : 'none';
+        if (!progress) return;
+
+        let label = STAGE_LABELS[progress.stage] || progress.stage;
+        if (progress.stage === 'encode' && progress.total) {
+            label += ` frame ${progress.current}/${progress.total}`;
+        }
+        document.getElementById('render-stage').textContent = label;
+        document.getElementById('render-percent').textContent = `${Math.round(progress.progress)}%`;
+        document.getElementById('render-progress-bar').style.width = `${progress.progress}%`;
+    }
+
+    function waitForJob(jobId) {
+        if (!window.EventSource) {
+            return pollJob(jobId);
+        }
+
+        return new Promise((resolve, reject) => {
+            const events = new EventSource(`/jobs/${jobId}/events`);
+            events.onmessage = (e) => {
+                const progress = JSON.parse(e.data);
+                showRenderProgress(progress);
+                if (progress.stage === 'done' || progress.stage === 'failed') {
+                    events.close();
+                    // The job record carries the error message for failed renders
+                    pollJob(jobId).then(resolve, reject);
+                }
+            };
+            events.onerror = () => {
+                // Fall back to polling if the stream drops
+                events.close();
+                pollJob(jobId).then(resolve, reject);
+            };
+        });
+    }
+
+    async function pollJob(jobId) {
+        while (true) {
+            const response = await fetch(`/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+
+            const job = await response.json();
+            showRenderProgress(job.progress);
+            if (job.status === 'done') {
+                return job;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Render failed');
+            }
+
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     function updateDurationDisplay() {
         const totalDuration = window.timelineManager.calculateTotalDuration();
         const durationDisplay = document.createElement('div');
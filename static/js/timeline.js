@@ -73,32 +73,23 @@ class Timeline {
                 // Handle image preview
                 preview.style.display = 'none';
                 const img = document.createElement('img');
-                img.src = URL.createObjectURL(new Blob([Uint8Array.from(atob(item.file_data), c => c.charCodeAt(0))]));
+                img.src = `/media/${item.media_id}`;
                 img.className = 'preview-image w-100';
                 preview.parentElement.insertBefore(img, preview);
 
                 // Remove image after duration
                 setTimeout(() => {
-                    URL.revokeObjectURL(img.src);
                     img.remove();
                     preview.style.display = 'block';
                 }, item.duration * 1000);
             } else {
                 // Handle video preview
-                const videoBlob = new Blob([Uint8Array.from(atob(item.file_data), c => c.charCodeAt(0))], {type: 'video/mp4'});
-                preview.src = URL.createObjectURL(videoBlob);
+                preview.src = `/media/${item.media_id}`;
                 preview.style.display = 'block';
                 preview.load();
                 preview.play()
-                    .then(() => {
-                        // Cleanup after video ends
-                        preview.onended = () => {
-                            URL.revokeObjectURL(preview.src);
-                        };
-                    })
                     .catch(error => {
                         console.error('Preview playback failed:', error);
-                        URL.revokeObjectURL(preview.src);
                     });
             }
         } catch (error) {
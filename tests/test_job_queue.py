@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import Future
+import pytest
+from job_queue import RenderJobQueue, DEFAULT_PRIORITY, PREVIEW_PRIORITY
+from render_cache import RenderCache
+
+
+class RecordingExecutor:
+    """Stands in for the process pool: records dispatched jobs, which finish only when told to."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, job_id, *args):
+        future = Future()
+        self.jobs.append((job_id, future))
+        return future
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.jobs) < count:
+            if time.monotonic() > deadline:
+                raise AssertionError(f"{len(self.jobs)} jobs dispatched, expected {count}")
+            time.sleep(0.01)
+
+    def finish(self, job_id):
+        dict(self.jobs)[job_id].set_result(None)
+
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(RenderCache, '_instance', RenderCache(str(tmp_path / 'cache'), 0))
+    queue = RenderJobQueue(str(tmp_path / 'jobs'), max_workers=1)
+    queue._executor = RecordingExecutor()
+    return queue
+
+
+def settle():
+    """Give the dispatcher time to pick up whatever it can."""
+    time.sleep(0.2)
+
+
+def timeline(name):
+    return [{'filename': name, 'filepath': f'/media/{name}', 'duration': 1}]
+
+
+def test_high_priority_job_overtakes_queued_jobs_while_workers_are_busy(job_queue):
+    executor = job_queue._executor
+    running = job_queue.submit(timeline('running.mp4'))
+    executor.wait_for(1)
+
+    first = job_queue.submit(timeline('first.mp4'), priority=DEFAULT_PRIORITY)
+    settle()
+    second = job_queue.submit(timeline('second.mp4'), priority=DEFAULT_PRIORITY)
+    urgent = job_queue.submit(timeline('urgent.mp4'), priority=1)
+    assert job_queue.queue_position(urgent) == 0
+    assert job_queue.get_job(first)['status'] == 'queued'
+
+    for count, job_id in enumerate((running, urgent, first), start=2):
+        executor.finish(job_id)
+        executor.wait_for(count)
+    assert [job_id for job_id, _ in executor.jobs] == [running, urgent, first, second]
+
+
+def test_preview_is_dispatched_before_queued_exports(job_queue):
+    executor = job_queue._executor
+    running = job_queue.submit(timeline('running.mp4'))
+    executor.wait_for(1)
+
+    exports = [job_queue.submit(timeline(f'export{i}.mp4')) for i in range(2)]
+    settle()
+    preview = job_queue.submit(timeline('preview.mp4'), priority=PREVIEW_PRIORITY, preview={'scale': 0.25})
+    assert job_queue.queue_position(preview) == 0
+    assert job_queue.queue_position(exports[1]) == 2
+
+    executor.finish(running)
+    executor.wait_for(2)
+    assert executor.jobs[1][0] == preview
+    assert job_queue.get_job(preview)['status'] == 'running'
+    assert all(job_queue.get_job(job_id)['status'] == 'queued' for job_id in exports)
@@ -1,15 +1,33 @@
 import os
+import bisect
 import logging
-import base64
 import tempfile
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 import moviepy.editor as mp
-from moviepy.video.fx import all as vfx
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+from moviepy.audio.io.readers import FFMPEG_AudioReader
 import cv2
 import numpy as np
+from PIL import Image, ImageSequence
+from proglog import ProgressBarLogger
+from output_profile import OutputProfile, DEFAULT_PROFILE
+from filters import item_filters, build_filters, is_temporal
+from frame_cache import FrameCache
 
 
 logger = logging.getLogger(__name__)
 
+# GIFs whose decoded frame table would be larger are streamed from FFmpeg
+GIF_MEMORY_BYTES = int(os.environ.get('GIF_MEMORY_MB', 64)) * 1024 * 1024
+# Like FFmpeg, a frame delay of 0 plays as 100 ms
+GIF_DEFAULT_DELAY_MS = 100
+# Filter thread pools kept per process, one per worker count
+FILTER_POOLS = 2
+
 def get_media_resolution(clip):
     """Get the resolution of a media clip."""
     try:
@@ -32,843 +50,1076 @@ def get_max_resolution(clips):
 
     return max_width or 1920, max_height or 1080  # Default to 1080p if no valid media
 
+def scale_resolution(width, height, scale):
+    """Scale a resolution, keeping both sides even for 4:2:0 encoding."""
+    return max(2, int(round(width * scale / 2)) * 2), max(2, int(round(height * scale / 2)) * 2)
+
 def calculate_progress(t, clip_duration, duration, position):
     if position == 'start':
         return min(1, t / duration)
     else:
         return max(0, (clip_duration - t) / duration)
 
-def resize_clip_maintain_aspect(clip, target_width, target_height):
-    """Resize clip maintaining aspect ratio with padding if needed."""
-    try:
-        orig_width, orig_height = clip.size
-        orig_aspect = orig_width / orig_height
-        target_aspect = target_width / target_height
-
-        # Create a black background clip
-        bg_clip = mp.ColorClip(size=(target_width, target_height), color=(0, 0, 0))
-        bg_clip = bg_clip.set_duration(clip.duration)
-
-        if orig_aspect > target_aspect:  # Width is the limiting factor
-            new_width = target_width
-            new_height = int(target_width / orig_aspect)
-            scaled_clip = clip.resize(width=new_width, height=new_height)
-            y_position = (target_height - new_height) // 2
-            positioned_clip = scaled_clip.set_position(("center", y_position))
-        else:  # Height is the limiting factor
-            new_height = target_height
-            new_width = int(target_height * orig_aspect)
-            scaled_clip = clip.resize(width=new_width, height=new_height)
-            x_position = (target_width - new_width) // 2
-            positioned_clip = scaled_clip.set_position((x_position, "center"))
-
-        return mp.CompositeVideoClip([bg_clip, positioned_clip])
-    except Exception as e:
-        logger.error(f"Failed to resize clip: {str(e)}")
+@lru_cache(maxsize=8)
+def warp_geometry(width, height, kind):
+    """Progress-independent float32 fields of a warp transition, cached per frame size and read-only."""
+    X, Y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+    Xc = X - np.float32(width / 2)
+    Yc = Y - np.float32(height / 2)
+
+    if kind == 'swirl':
+        # np.arctan2 rather than cv2.cartToPolar, whose angles are only accurate to ~0.3 degrees
+        radius = cv2.magnitude(Xc, Yc)
+        theta = np.arctan2(Yc, Xc)
+        falloff = np.exp(-(radius ** 2) / np.float32(2 * (max(width, height) / 2) ** 2))
+        fields = (radius, theta, falloff)
+    elif kind == 'wave':
+        # The horizontal shift only depends on the row
+        rows = np.sin(np.float32(2 * np.pi * 2 / 30) * Y[:, :1])
+        fields = (X, Y, rows)
+    elif kind == 'ripple':
+        distance = cv2.magnitude(Xc, Yc)
+        wave = np.sin(np.float32(2 * np.pi / 20) * distance)
+        distance += np.float32(1e-5)
+        fields = (X, Y, wave * Xc / distance, wave * Yc / distance)
+    else:
+        raise ValueError(f"Unknown warp '{kind}'")
+
+    for field in fields:
+        field.flags.writeable = False
+    return fields
+
+@lru_cache(maxsize=16)
+def reveal_field(width, height, kind):
+    """Float32 reveal order of a mask transition, computed once per frame size and thresholded by reveal_mask."""
+    if kind == 'dissolve':
+        # Same noise as the old per-frame np.random.seed(42) field
+        field = np.random.RandomState(42).random_sample((height, width)).astype(np.float32)
+    elif kind == 'wipe':
+        field = np.broadcast_to((np.arange(width, dtype=np.float32) + 1) / width, (height, width)).copy()
+    else:
+        y, x = np.ogrid[:height, :width]
+        dx = (x - width // 2).astype(np.float64)
+        dy = (y - height // 2).astype(np.float64)
+        if kind == 'circle-wipe':
+            field = np.sqrt(dx ** 2 + dy ** 2) / np.sqrt((width // 2) ** 2 + (height // 2) ** 2)
+        elif kind == 'heart':
+            # (r^2 - s^2)^3 < dx^2 dy^3  <=>  r^2 - cbrt(dx^2 dy^3) < s^2
+            field = (dx ** 2 + dy ** 2 - np.cbrt(dx ** 2 * dy ** 3)) / min(width, height) ** 2
+        else:
+            raise ValueError(f"Unknown reveal transition '{kind}'")
+        field = field.astype(np.float32)
+    field.flags.writeable = False
+    return field
+
+def reveal_mask(width, height, kind, progress):
+    """uint8 mask (0/255) of the pixels a mask transition shows at this progress."""
+    field = reveal_field(width, height, kind)
+    if kind == 'dissolve':
+        return cv2.compare(field, progress, cv2.CMP_LT)
+    if kind == 'wipe':
+        return cv2.compare(field, int(width * progress) / width, cv2.CMP_LE)
+    if kind == 'circle-wipe':
+        return cv2.compare(field, progress, cv2.CMP_LE)
+    size = int(min(width, height) * progress) / min(width, height)
+    return cv2.compare(field, size * size, cv2.CMP_LT)
+
+def apply_mask(frame, mask):
+    """Keep the frame where mask is set and black elsewhere, without float math."""
+    return cv2.copyTo(frame, mask)
+
+DEFAULT_TRANSITION_GRID = {'shatter': 20, 'tile': 10}
+MAX_TRANSITION_GRID = 100
+
+def transition_grid(options, kind):
+    """Grid size of a block transition from the item's transition options."""
+    grid = int(options.get('grid', DEFAULT_TRANSITION_GRID[kind]))
+    return min(max(grid, 1), MAX_TRANSITION_GRID)
+
+def check_transition_options(options):
+    """Raise ValueError unless an item's transitionOptions hold a usable 'grid' and 'seed'."""
+    options = options or {}
+    if not isinstance(options, dict):
+        raise ValueError('must be an object')
+    for name in ('grid', 'seed'):
+        if name in options:
+            try:
+                int(options[name])
+            except (TypeError, ValueError):
+                raise ValueError(f'{name} must be an integer')
+    # NumPy seeds must fit in 32 bits
+    if 'seed' in options and not 0 <= int(options['seed']) < 2 ** 32:
+        raise ValueError('seed must be between 0 and 2**32 - 1')
+
+def transition_seed(item):
+    """Seed of an item's random transitions, stable across renders of the same media."""
+    options = item.get('transitionOptions') or {}
+    if 'seed' in options:
+        return int(options['seed'])
+    return zlib.crc32(str(item.get('media_id') or item.get('filepath', '')).encode())
+
+def grid_edges(length, cells):
+    """Cell boundaries along one axis; the last cell takes the remainder."""
+    size = max(length // cells, 1)
+    edges = np.minimum(np.arange(cells + 1) * size, length)
+    edges[-1] = length
+    return edges
+
+@lru_cache(maxsize=8)
+def shatter_layout(width, height, grid):
+    """Origins and sizes of the shatter pieces, one entry per piece in row-major order."""
+    ys, xs = grid_edges(height, grid), grid_edges(width, grid)
+    y1, x1 = np.meshgrid(ys[:-1], xs[:-1], indexing='ij')
+    ph, pw = np.meshgrid(np.diff(ys), np.diff(xs), indexing='ij')
+    layout = tuple(a.ravel() for a in (y1, x1, ph, pw))
+    for a in layout:
+        a.flags.writeable = False
+    return layout
+
+def shatter_frame(frame, progress, grid, seed, t):
+    """Scatter the frame's pieces by random offsets that shrink as progress grows.
+
+    Offsets for all pieces are drawn in one call from a generator seeded by
+    (seed, time), so a frame looks the same however often it is rendered.
+    """
+    h, w = frame.shape[:2]
+    y1, x1, ph, pw = shatter_layout(w, h, grid)
+    rng = np.random.default_rng((seed, int(round(t * 1000))))
+    dy, dx = rng.normal(0, 50 * (1 - progress), (2, y1.size)).astype(np.int64)
+    new_y = np.clip(y1 + dy, 0, h - ph)
+    new_x = np.clip(x1 + dx, 0, w - pw)
+
+    # Pieces are whole rectangles, so a slice copy per piece moves them far
+    # faster than per-pixel fancy indexing; later pieces land on top
+    shattered = np.zeros_like(frame)
+    for sy, sx, ty, tx, bh, bw in zip(y1.tolist(), x1.tolist(), new_y.tolist(), new_x.tolist(),
+                                      ph.tolist(), pw.tolist()):
+        shattered[ty:ty + bh, tx:tx + bw] = frame[sy:sy + bh, sx:sx + bw]
+    return shattered
+
+@lru_cache(maxsize=8)
+def tile_layout(width, height, grid, seed):
+    """Reveal thresholds of the tile transition (one random value per tile) and the tile sizes."""
+    thresholds = np.random.RandomState(seed).random_sample((grid, grid))
+    rows = np.diff(grid_edges(height, grid))
+    cols = np.diff(grid_edges(width, grid))
+    return thresholds, rows, cols
+
+def tile_mask(width, height, grid, seed, progress, position):
+    """Full-size uint8 mask of the tiles visible at this progress.
+
+    Tiles appear once progress passes their threshold and, on the way out,
+    disappear once 1 - progress does.
+    """
+    thresholds, rows, cols = tile_layout(width, height, grid, seed)
+    if position == 'start':
+        tiles = thresholds < progress
+    else:
+        tiles = thresholds >= 1 - progress
+    # Evaluated per tile, then expanded, so the per-frame cost does not grow with the grid
+    tiles = tiles.astype(np.uint8) * 255
+    return np.repeat(np.repeat(tiles, rows, axis=0), cols, axis=1)
+
+FIT_MODES = ('contain', 'cover', 'stretch')
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'area': cv2.INTER_AREA,
+    'lanczos': cv2.INTER_LANCZOS4
+}
+
+def fit_geometry(orig_width, orig_height, target_width, target_height, mode='contain'):
+    """Return (crop, dest): the (x, y, w, h) region of the source used and where it lands in the target."""
+    if mode == 'stretch':
+        return (0, 0, orig_width, orig_height), (0, 0, target_width, target_height)
+
+    orig_aspect = orig_width / orig_height
+    target_aspect = target_width / target_height
+
+    if mode == 'cover':
+        if orig_aspect > target_aspect:  # Crop the sides
+            crop_width = max(1, int(orig_height * target_aspect))
+            crop = ((orig_width - crop_width) // 2, 0, crop_width, orig_height)
+        else:  # Crop top and bottom
+            crop_height = max(1, int(orig_width / target_aspect))
+            crop = (0, (orig_height - crop_height) // 2, orig_width, crop_height)
+        return crop, (0, 0, target_width, target_height)
+
+    if orig_aspect > target_aspect:  # Width is the limiting factor
+        new_width = target_width
+        new_height = max(1, int(target_width / orig_aspect))
+        dest = (0, (target_height - new_height) // 2, new_width, new_height)
+    else:  # Height is the limiting factor
+        new_height = target_height
+        new_width = max(1, int(target_height * orig_aspect))
+        dest = ((target_width - new_width) // 2, 0, new_width, new_height)
+    return (0, 0, orig_width, orig_height), dest
+
+def fit_frame(frame, target_width, target_height, mode='contain', interpolation=None, out=None):
+    """Resize a frame into its region of out (black if not given), leaving the letterbox bars untouched."""
+    orig_height, orig_width = frame.shape[:2]
+    (cx, cy, cw, ch), (dx, dy, dw, dh) = fit_geometry(orig_width, orig_height, target_width, target_height, mode)
+
+    if out is None:
+        out = np.zeros((target_height, target_width, 3), dtype=np.uint8)
+    if interpolation is None:
+        # Same choice MoviePy makes: area averaging to shrink, bilinear to enlarge
+        interpolation = cv2.INTER_AREA if dw * dh < cw * ch else cv2.INTER_LINEAR
+
+    if frame.ndim == 2:
+        frame = np.dstack([frame] * 3)
+    source = frame[cy:cy + ch, cx:cx + cw, :3]
+    if source.dtype != np.uint8:
+        source = np.clip(source, 0, 255).astype(np.uint8)
+    cv2.resize(source, (dw, dh), dst=out[dy:dy + dh, dx:dx + dw], interpolation=interpolation)
+    return out
+
+def flatten_mask(clip):
+    """Composite a clip with a transparency mask onto black and drop the mask."""
+    if clip.mask is None:
         return clip
+    if isinstance(clip, mp.ImageClip):
+        flat = (clip.img * clip.mask.img[:, :, None]).astype(np.uint8)
+        return mp.ImageClip(flat, duration=clip.duration)
 
-def apply_filter(clip, filter_type):
-    """Apply video filter to clip."""
-    try:
-        # Keep all existing filter cases unchanged
-        if filter_type == 'grayscale':
-            return clip.fx(vfx.blackwhite)
-        elif filter_type == 'sepia':
-            def make_sepia(frame):
-                frame_array = np.array(frame)
-                sepia_matrix = np.array([
-                    [0.393, 0.769, 0.189],
-                    [0.349, 0.686, 0.168],
-                    [0.272, 0.534, 0.131]
-                ])
-                sepia_image = np.dot(frame_array[...,:3], sepia_matrix.T)
-                sepia_image = np.clip(sepia_image, 0, 255).astype(np.uint8)
-                return sepia_image
-            return clip.fl_image(make_sepia)
-        elif filter_type == 'blur':
-            def blur_frame(frame):
-                return cv2.GaussianBlur(frame, (15, 15), 0)
-            return clip.fl_image(blur_frame)
-        elif filter_type == 'sharpen':
-            def sharpen(frame):
-                kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-                return cv2.filter2D(frame, -1, kernel)
-            return clip.fl_image(sharpen)
-        elif filter_type == 'bright':
-            return clip.fx(vfx.colorx, factor=1.5)
-        elif filter_type == 'dark':
-            return clip.fx(vfx.colorx, factor=0.5)
-        elif filter_type == 'contrast':
-            return clip.fx(vfx.lum_contrast, contrast=50)
-        elif filter_type == 'mirror':
-            return clip.fx(vfx.mirror_x)
-
-        # New filters start here
-        elif filter_type == 'cartoon':
-            def cartoonize(frame):
-                # Converte o frame para um array numpy
-                img = np.array(frame)
-
-                # Importa cv2 dentro da função
-                import cv2
-
-                # Converte para escala de cinza
-                gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-
-                # Reduz o blur para manter mais detalhes (de 7 para 3)
-                blurred = cv2.medianBlur(gray, 1)
-
-                # Ajusta o threshold para bordas mais nítidas
-                edges = cv2.adaptiveThreshold(blurred, 255,
-                                              cv2.ADAPTIVE_THRESH_MEAN_C,
-                                              cv2.THRESH_BINARY, 9, 9)
-
-                # Reduz menos as cores para manter detalhes (ajuste nos parâmetros do bilateral)
-                color = cv2.bilateralFilter(img, 7, 150, 150)
-
-                # Combina as bordas com as cores
-                cartoon = cv2.bitwise_and(color, color, mask=edges)
-
-                return cartoon
-
-            return clip.fl_image(cartoonize)
-
-
-        elif filter_type == 'oil_painting':
-
-            def oil_paint(frame):
-                # Convert from RGB (MoviePy) to BGR (OpenCV)
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-
-                # Apply smoothing to simulate brush strokes
-                smoothed = cv2.medianBlur(frame_bgr, 7)
-
-                # Enhance contrast and brightness
-                enhanced = cv2.convertScaleAbs(smoothed, alpha=1.1, beta=10)  # Menos contraste para evitar exagero
-
-                # Convert to HSV to adjust saturation
-                hsv = cv2.cvtColor(enhanced, cv2.COLOR_BGR2HSV)
-                hsv[:, :, 1] = cv2.multiply(hsv[:, :, 1], 1.40)  # Aumenta saturação em 50%
-
-                # Convert back to RGB
-                frame_rgb = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
-
-                return frame_rgb
-
-            return clip.fl_image(oil_paint)
-
-
-        # Rainbow Filter
-
-        elif filter_type == 'rainbow':
-
-            def add_rainbow(frame):
-
-                height, width = frame.shape[:2]
-
-                rainbow = np.zeros((height, width, 3), dtype=np.uint8)
-
-                for i in range(width):
-                    hue = int((i / width) * 180)
-
-                    rainbow[:, i] = [hue, 255, 255]
-
-                rainbow = cv2.cvtColor(rainbow, cv2.COLOR_HSV2RGB)
-
-                return cv2.addWeighted(frame, 0.7, rainbow, 0.3, 0)
-
-            return clip.fl_image(add_rainbow)
-
-        elif filter_type == 'neon':
-            def neon_effect(frame):
-                # Edge detection
-                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-                edges = cv2.Canny(gray, 100, 200)
-                edges = cv2.dilate(edges, None)
-                # Create neon effect
-                edges = cv2.GaussianBlur(edges, (9, 9), 0)
-                # Colorize edges
-                edges_color = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-                edges_color[:,:,0] = edges  # Blue channel
-                edges_color[:,:,1] = 0      # Green channel
-                edges_color[:,:,2] = edges  # Red channel
-                # Blend with original
-                return cv2.addWeighted(frame, 0.7, edges_color, 0.3, 0)
-            return clip.fl_image(neon_effect)
-
-        elif filter_type == 'thermal':
-            def thermal_effect(frame):
-                # Convert to grayscale
-                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-                # Apply color map
-                thermal = cv2.applyColorMap(gray, cv2.COLORMAP_JET)
-                # Convert back to RGB
-                return cv2.cvtColor(thermal, cv2.COLOR_BGR2RGB)
-            return clip.fl_image(thermal_effect)
-
-        elif filter_type == 'pencil_sketch':
-            def sketch_effect(frame):
-                # Convert to grayscale
-                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-                # Invert
-                inv = 255 - gray
-                # Apply Gaussian blur
-                blur = cv2.GaussianBlur(inv, (21, 21), 0)
-                # Blend
-                sketch = cv2.divide(gray, 255-blur, scale=256.0)
-                # Convert back to RGB
-                return cv2.cvtColor(sketch, cv2.COLOR_GRAY2RGB)
-            return clip.fl_image(sketch_effect)
-
-        # New filters
-        elif filter_type == 'invert':
-            def invert(frame):
-                return cv2.bitwise_not(frame)
-
-            return clip.fl_image(invert)
-
-        elif filter_type == 'emboss':
-            def emboss(frame):
-                kernel = np.array([[-2, -1, 0], [-1, 1, 1], [0, 1, 2]])
-                embossed = cv2.filter2D(frame, -1, kernel)
-                return cv2.cvtColor(embossed, cv2.COLOR_BGR2RGB)
-
-            return clip.fl_image(emboss)
-
-
-        # Glitch Effect Filter
-
-        elif filter_type == 'glitch':
-
-            def glitch_effect(frame):
-
-                height, width, _ = frame.shape
-
-                shift = width // 10
-
-                frame[:, :shift] = np.flip(frame[:, :shift], axis=1)
-
-                frame[:, width - shift:] = np.flip(frame[:, width - shift:], axis=1)
-
-                return frame
-
-            return clip.fl_image(glitch_effect)
-
-
-        # Pixelate Filter
-
-        elif filter_type == 'pixelate':
-
-            def pixelate(frame):
-
-                height, width = frame.shape[:2]
-
-                small = cv2.resize(frame, (width // 10, height // 10), interpolation=cv2.INTER_LINEAR)
-
-                return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
-
-            return clip.fl_image(pixelate)
-
-        elif filter_type == 'edge_detect':
-            def edge_detect(frame):
-                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-                edges = cv2.Canny(gray, 100, 200)
-                return cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-
-            return clip.fl_image(edge_detect)
-
-        elif filter_type == 'posterize':
-            def posterize(frame):
-                return cv2.convertScaleAbs(frame // 64 * 64)
-
-            return clip.fl_image(posterize)
-
-
-        # Solarize Filter
+    mask = clip.mask
+    flat_clip = clip.fl(lambda gf, t: (gf(t) * mask.get_frame(t)[:, :, None]).astype(np.uint8))
+    flat_clip.mask = None
+    return flat_clip
 
-        elif filter_type == 'solarize':
-
-            def solarize(frame):
-
-                # Converte para escala de cinza para análise de brilho
-
-                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-
-                _, mask = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
-
-                # Inverte apenas as áreas brilhantes
-
-                inverted = cv2.bitwise_not(frame)
+def resize_clip_maintain_aspect(clip, target_width, target_height, mode='contain', interpolation=None):
+    """Resize clip to the target size with one of FIT_MODES and INTERPOLATIONS."""
+    try:
+        if mode not in FIT_MODES:
+            raise ValueError(f"Unknown fit mode {mode}")
+        interpolation = INTERPOLATIONS.get(interpolation) if interpolation else None
 
-                result = np.where(mask[..., None] == 255, inverted, frame)
+        clip = flatten_mask(clip)
+        if tuple(clip.size) == (target_width, target_height):
+            return clip
 
-                return result
+        if isinstance(clip, mp.ImageClip):
+            # Computed once by ImageClip.fl_image, so it gets a canvas of its own
+            return clip.fl_image(lambda frame: fit_frame(frame, target_width, target_height, mode, interpolation))
 
-            return clip.fl_image(solarize)
+        # One canvas per clip, handed out read-only so in-place edits can't leak into the next frame
+        canvas = np.zeros((target_height, target_width, 3), dtype=np.uint8)
 
-        elif filter_type == 'vignette':
-            def vignette(frame):
-                rows, cols = frame.shape[:2]
-                kernel_x = cv2.getGaussianKernel(cols, 200)
-                kernel_y = cv2.getGaussianKernel(rows, 200)
-                kernel = kernel_y * kernel_x.T
-                mask = 255 * kernel / np.linalg.norm(kernel)
-                vignette = np.copy(frame)
-                for i in range(3):
-                    vignette[:, :, i] = vignette[:, :, i] * mask
-                return vignette.astype(np.uint8)
+        def fit(frame):
+            canvas.flags.writeable = True
+            fit_frame(frame, target_width, target_height, mode, interpolation, out=canvas)
+            canvas.flags.writeable = False
+            return canvas
 
-            return clip.fl_image(vignette)
+        return clip.fl_image(fit)
+    except Exception as e:
+        logger.error(f"Failed to resize clip: {str(e)}")
+        return clip
 
-        elif filter_type == 'halftone':
-            def halftone(frame):
-                gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-                _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
-                return cv2.cvtColor(binary, cv2.COLOR_GRAY2RGB)
+_filter_pools = OrderedDict()
+_filter_pools_lock = Lock()
+
+def filter_pool(workers):
+    """Thread pool shared by the batched filter stages of a render process."""
+    with _filter_pools_lock:
+        pool = _filter_pools.pop(workers, None) or ThreadPoolExecutor(max_workers=workers,
+                                                                      thread_name_prefix='filter')
+        _filter_pools[workers] = pool
+        while len(_filter_pools) > FILTER_POOLS:
+            # Frames already handed to an evicted pool still finish; its threads exit afterwards
+            _filter_pools.popitem(last=False)[1].shutdown(wait=False)
+        return pool
+
+class BatchedFilter:
+    """Filter frames on a thread pool, decoding up to batch frames ahead.
+
+    Frames are decoded on the calling thread, as decoders aren't thread-safe; a seek drops the read-ahead.
+    """
+
+    def __init__(self, steps, duration, batch, pool):
+        self.steps = steps
+        self.duration = duration
+        self.batch = batch
+        self.pool = pool
+        self.pending = {}
+        self.last = None
+        self.last_t = None
+        self.spacing = None
+
+    def run(self, frame):
+        for step in self.steps:
+            frame = step(frame)
+        return frame
+
+    def __call__(self, get_frame, t):
+        key = round(t * 1e6)
+        if self.last is not None and self.last[0] == key:
+            return self.last[1]
+
+        future = self.pending.pop(key, None)
+        if future is None:
+            for stale in self.pending.values():
+                stale.cancel()
+            self.pending.clear()
+            future = self.pool.submit(self.run, get_frame(t).copy())
+        if self.last_t is not None and t > self.last_t:
+            self.spacing = t - self.last_t
+        self.last_t = t
+
+        if self.spacing:
+            for k in range(1, self.batch + 1):
+                # Snapped to the microsecond so float error can't land a read-ahead
+                # just short of a frame boundary (e.g. where a GIF loops)
+                ahead = round(t + k * self.spacing, 6)
+                if ahead >= self.duration:
+                    break
+                ahead_key = round(ahead * 1e6)
+                if ahead_key not in self.pending:
+                    self.pending[ahead_key] = self.pool.submit(self.run, get_frame(ahead).copy())
+
+        frame = future.result()
+        self.last = (key, frame)
+        return frame
+
+def apply_filters(clip, filters, workers=1, batch=1):
+    """Apply a chain of (name, settings) filters to clip in a single pass over each frame."""
+    try:
+        steps = build_filters(filters)
+        if not steps:
+            return clip
 
-            return clip.fl_image(halftone)
+        def run_filters(frame):
+            for step in steps:
+                frame = step(frame)
+            return frame
+
+        if isinstance(clip, mp.ImageClip) and not is_temporal(filters):
+            # ImageClip.fl_image filters the image once for all frames
+            return clip.fl_image(run_filters)
+        if workers > 1:
+            return clip.fl(BatchedFilter(steps, clip.duration, batch, filter_pool(workers)))
+        if isinstance(clip, mp.ImageClip):
+            return clip.fl(lambda gf, t: run_filters(gf(t)))
+        return clip.fl_image(run_filters)
+    except Exception as e:
+        logger.error(f"Failed to apply filters {', '.join(name for name, _ in filters)}: {str(e)}")
+        return clip
 
-        elif filter_type == 'noise':
-            def add_noise(frame):
-                noise = np.random.normal(0, 25, frame.shape).astype(np.uint8)
-                noisy_frame = cv2.add(frame, noise)
-                return np.clip(noisy_frame, 0, 255)
+def apply_filter(clip, filter_type):
+    """Apply video filter to clip."""
+    return apply_filters(clip, [(filter_type, {})])
+# Mapeamento dos nomes de transição (UI) para os nomes internos e posição
+TRANSITION_MAP = {
+    # Transições existentes
+    'fade-in': ('fade', 'start'),
+    'fade-out': ('fade', 'end'),
+    'dissolve-in': ('dissolve', 'start'),
+    'dissolve-out': ('dissolve', 'end'),
+    'wipe-right': ('wipe', 'start'),
+    'wipe-left': ('wipe', 'end'),
+    'slide-right': ('slide', 'start'),
+    'slide-left': ('slide', 'end'),
+    'rotate-in': ('rotate', 'start'),
+    'rotate-out': ('rotate', 'end'),
+    'zoom-in': ('zoom', 'start'),
+    'zoom-out': ('zoom', 'end'),
+    'blur-in': ('blur', 'start'),
+    'blur-out': ('blur', 'end'),
+    'ripple-in': ('ripple', 'start'),
+    'ripple-out': ('ripple', 'end'),
+    'spiral-in': ('spiral', 'start'),
+    'spiral-out': ('spiral', 'end'),
+    'matrix-in': ('matrix', 'start'),
+    'matrix-out': ('matrix', 'end'),
+    'heart-in': ('heart', 'start'),
+    'heart-out': ('heart', 'end'),
+    'shatter-in': ('shatter', 'start'),
+    'shatter-out': ('shatter', 'end'),
+    # Novas transições
+    'glitch-in': ('glitch', 'start'),
+    'glitch-out': ('glitch', 'end'),
+    'pixelate-in': ('pixelate', 'start'),
+    'pixelate-out': ('pixelate', 'end'),
+    'circle-wipe-in': ('circle-wipe', 'start'),
+    'circle-wipe-out': ('circle-wipe', 'end'),
+    'swirl-in': ('swirl', 'start'),
+    'swirl-out': ('swirl', 'end'),
+    'wave-in': ('wave', 'start'),
+    'wave-out': ('wave', 'end'),
+    'tile-in': ('tile', 'start'),
+    'tile-out': ('tile', 'end'),
+    'color-shift-in': ('color-shift', 'start'),
+    'color-shift-out': ('color-shift', 'end')
+}
+
+class TransitionOp:
+    """A transition effect(frame, t, progress) that only runs in the first or last duration seconds of a clip."""
+
+    def __init__(self, name, position, duration, clip_duration, effect):
+        self.name = name
+        self.position = position
+        self.duration = duration
+        self.clip_duration = clip_duration
+        self.effect = effect
+
+    def active(self, t):
+        if self.position == 'start':
+            return t < self.duration
+        return t > self.clip_duration - self.duration
+
+    def progress(self, t):
+        if self.position == 'start':
+            return max(0, t / self.duration)
+        return max(0, (self.clip_duration - t) / self.duration)
+
+    def __call__(self, frame, t):
+        return self.effect(frame, t, self.progress(t))
+
+def transition_operator(clip, transition_type='fade-in', duration=1.0, position='start', options=None):
+    """Build the TransitionOp of a transition, or None if it does nothing."""
+    options = options or {}
+    if transition_type == 'none':
+        return None
 
-            return clip.fl_image(add_noise)
+    internal_type, internal_position = TRANSITION_MAP.get(transition_type, (transition_type, position))
+
+    # ---------------------------------------------------
+    # Transições já implementadas (fade, dissolve, wipe, slide, rotate, zoom, blur, matrix, heart, shatter)
+    # ---------------------------------------------------
+    if internal_type == 'matrix':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            # Efeito digital "Matrix"
+            matrix = np.random.rand(h, w) < (progress * 0.3)
+            rain = np.roll(matrix, int(progress * h // 2), axis=0)
+            rain = np.dstack([rain * 0.1, rain * 0.8, rain * 0.3])  # tonalidade verde
+            return cv2.addWeighted(frame, progress, (rain * 255).astype(np.uint8), 1 - progress, 0)
+
+    elif internal_type in ('heart', 'dissolve', 'wipe', 'circle-wipe'):
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            return apply_mask(frame, reveal_mask(w, h, internal_type, progress))
+
+    elif internal_type == 'shatter':
+        grid = transition_grid(options, 'shatter')
+        seed = int(options.get('seed', 0))
+        def effect(frame, t, progress):
+            return shatter_frame(frame, progress, grid, seed, t)
+
+    elif internal_type == 'fade':
+        # Fades from and to black, like vfx.fadein/fadeout
+        def effect(frame, t, progress):
+            return cv2.convertScaleAbs(frame, alpha=progress)
+
+    elif internal_type == 'slide':
+        # The clip slides in from (or out to) the left over a black background
+        def effect(frame, t, progress):
+            w = frame.shape[1]
+            shift = int(w * (1 - progress))
+            slid = np.zeros_like(frame)
+            slid[:, :w - shift] = frame[:, shift:]
+            return slid
+
+    elif internal_type == 'zoom':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            scale = 0.1 + 0.9 * progress
+            new_width = int(w * scale)
+            new_height = int(h * scale)
+            resized_frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+            output_frame = np.zeros_like(frame)
+            y_offset = (h - new_height) // 2
+            x_offset = (w - new_width) // 2
+            output_frame[y_offset:y_offset + new_height, x_offset:x_offset + new_width] = resized_frame
+            return output_frame
+
+    elif internal_type == 'rotate':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            center = (w // 2, h // 2)
+            angle = 360 * (1 - progress)
+            scale = progress
+            if scale > 0:
+                matrix = cv2.getRotationMatrix2D(center, angle, scale)
+                return cv2.warpAffine(frame, matrix, (w, h))
+            return np.zeros_like(frame)
+
+    elif internal_type == 'blur':
+        def effect(frame, t, progress):
+            sigma = 20 * (1 - progress)
+            return cv2.GaussianBlur(frame, (0, 0), sigma)
+
+    # ---------------------------------------------------
+    # Novas transições
+    # ---------------------------------------------------
+
+    elif internal_type == 'glitch':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            output = frame.copy()
+            stripe_height = 5  # altura da faixa em pixels
+            for y in range(0, h, stripe_height):
+                offset = int(np.random.normal(0, 30 * (1 - progress)))
+                y_end = min(y + stripe_height, h)
+                output[y:y_end, :] = np.roll(frame[y:y_end, :], shift=offset, axis=1)
+            return output
+
+    elif internal_type == 'pixelate':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            # De 10% (muito pixelado) a 100% (normal)
+            scale = 0.1 + 0.9 * progress
+            new_w = max(1, int(w * scale))
+            new_h = max(1, int(h * scale))
+            small = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_NEAREST)
+            return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    elif internal_type == 'swirl':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            center = (w / 2, h / 2)
+            max_angle = 2 * np.pi
+            angle_offset = max_angle * (1 - progress)
+            radius, theta, falloff = warp_geometry(w, h, 'swirl')
+            map_x, map_y = cv2.polarToCart(radius, cv2.scaleAdd(falloff, angle_offset, theta))
+            map_x += np.float32(center[0])
+            map_y += np.float32(center[1])
+            return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+    elif internal_type == 'wave':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            amplitude = 10 * (1 - progress)
+            X, map_y, rows = warp_geometry(w, h, 'wave')
+            map_x = X + np.float32(amplitude) * rows
+            return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+    elif internal_type == 'tile':
+        grid = transition_grid(options, 'tile')
+        seed = int(options.get('seed', 42))
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            return apply_mask(frame, tile_mask(w, h, grid, seed, progress, internal_position))
+
+    elif internal_type == 'color-shift':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            max_offset = 20
+            offset = int(max_offset * (1 - progress))
+            b, g, r = cv2.split(frame)
+            M_right = np.float32([[1, 0, offset], [0, 1, 0]])
+            M_left = np.float32([[1, 0, -offset], [0, 1, 0]])
+            shifted_r = cv2.warpAffine(r, M_right, (w, h))
+            shifted_b = cv2.warpAffine(b, M_left, (w, h))
+            return cv2.merge([shifted_b, g, shifted_r])
+
+    elif internal_type == 'ripple':
+        def effect(frame, t, progress):
+            amplitude = 5 * (1 - progress)
+            h, w = frame.shape[:2]
+            X, Y, dir_x, dir_y = warp_geometry(w, h, 'ripple')
+            map_x = cv2.scaleAdd(dir_x, amplitude, X)
+            map_y = cv2.scaleAdd(dir_y, amplitude, Y)
+            return cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+    elif internal_type == 'spiral':
+        def effect(frame, t, progress):
+            h, w = frame.shape[:2]
+            center = (w / 2, h / 2)
+            max_angle = 2 * np.pi
+            angle_offset = max_angle * (1 - progress)
+            # Turning every pixel by the same angle is a rotation about the centre
+            matrix = cv2.getRotationMatrix2D(center, -np.degrees(angle_offset), 1.0)
+            return cv2.warpAffine(frame, matrix, (w, h), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                  borderMode=cv2.BORDER_REFLECT)
 
-        elif filter_type == 'color_shift':
-            def color_shift(frame):
-                b, g, r = cv2.split(frame)
-                shifted = cv2.merge((g, r, b))
-                return shifted
+    else:
+        # Caso nenhuma transição seja aplicada, retorna None
+        logger.warning(f"Unknown transition {transition_type}")
+        return None
 
-            return clip.fl_image(color_shift)
+    return TransitionOp(internal_type, internal_position, duration, clip.duration, effect)
 
-        return clip
-    except Exception as e:
-        logger.error(f"Failed to apply filter {filter_type}: {str(e)}")
-        return clip
-def apply_transition(clip, transition_type='fade-in', duration=1.0, position='start'):
-    """Apply transition effect to a clip at the start or end."""
+def apply_transitions(clip, transitions, duration=1.0, options=None):
+    """Apply (transition_type, position) pairs to a clip through one frame wrapper."""
     try:
-        if transition_type == 'none':
-            return clip
-
-        # Armazena posição e tamanho original
-        original_pos = clip.pos if hasattr(clip, 'pos') else lambda t: ('center', 'center')
-        clip_width, clip_height = clip.size
-
-        # Mapeamento dos nomes de transição (UI) para os nomes internos e posição
-        transition_map = {
-            # Transições existentes
-            'fade-in': ('fade', 'start'),
-            'fade-out': ('fade', 'end'),
-            'dissolve-in': ('dissolve', 'start'),
-            'dissolve-out': ('dissolve', 'end'),
-            'wipe-right': ('wipe', 'start'),
-            'wipe-left': ('wipe', 'end'),
-            'slide-right': ('slide', 'start'),
-            'slide-left': ('slide', 'end'),
-            'rotate-in': ('rotate', 'start'),
-            'rotate-out': ('rotate', 'end'),
-            'zoom-in': ('zoom', 'start'),
-            'zoom-out': ('zoom', 'end'),
-            'blur-in': ('blur', 'start'),
-            'blur-out': ('blur', 'end'),
-            'ripple-in': ('ripple', 'start'),
-            'ripple-out': ('ripple', 'end'),
-            'spiral-in': ('spiral', 'start'),
-            'spiral-out': ('spiral', 'end'),
-            'matrix-in': ('matrix', 'start'),
-            'matrix-out': ('matrix', 'end'),
-            'heart-in': ('heart', 'start'),
-            'heart-out': ('heart', 'end'),
-            'shatter-in': ('shatter', 'start'),
-            'shatter-out': ('shatter', 'end'),
-            # Novas transições
-            'glitch-in': ('glitch', 'start'),
-            'glitch-out': ('glitch', 'end'),
-            'pixelate-in': ('pixelate', 'start'),
-            'pixelate-out': ('pixelate', 'end'),
-            'circle-wipe-in': ('circle-wipe', 'start'),
-            'circle-wipe-out': ('circle-wipe', 'end'),
-            'swirl-in': ('swirl', 'start'),
-            'swirl-out': ('swirl', 'end'),
-            'wave-in': ('wave', 'start'),
-            'wave-out': ('wave', 'end'),
-            'tile-in': ('tile', 'start'),
-            'tile-out': ('tile', 'end'),
-            'color-shift-in': ('color-shift', 'start'),
-            'color-shift-out': ('color-shift', 'end')
-        }
-
-        internal_type, internal_position = transition_map.get(transition_type, (transition_type, position))
-
-        # ---------------------------------------------------
-        # Transições já implementadas (fade, dissolve, wipe, slide, rotate, zoom, blur, matrix, heart, shatter)
-        # ---------------------------------------------------
-        if internal_type == 'matrix':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                # Efeito digital "Matrix"
-                matrix = np.random.rand(h, w) < (progress * 0.3)
-                rain = np.roll(matrix, int(progress * h // 2), axis=0)
-                rain = np.dstack([rain * 0.1, rain * 0.8, rain * 0.3])  # tonalidade verde
-                return cv2.addWeighted(frame, progress, (rain * 255).astype(np.uint8), 1 - progress, 0)
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'heart':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                center = (w // 2, h // 2)
-                size = int(min(w, h) * progress)
-                mask = np.zeros((h, w))
-                y, x = np.ogrid[:h, :w]
-                # Equação para forma de coração
-                inside_heart = ((x - center[0]) ** 2 + (y - center[1]) ** 2 - size ** 2) ** 3 - (x - center[0]) ** 2 * (y - center[1]) ** 3 < 0
-                mask[inside_heart] = 1
-                mask = np.dstack([mask, mask, mask])
-                return (frame * mask).astype(np.uint8)
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'shatter':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                pieces = 20
-                piece_h = h // pieces
-                piece_w = w // pieces
-                shattered = np.zeros_like(frame)
-                for i in range(pieces):
-                    for j in range(pieces):
-                        y1 = i * piece_h
-                        y2 = (i + 1) * piece_h
-                        x1 = j * piece_w
-                        x2 = (j + 1) * piece_w
-                        if progress < 1:
-                            dx = int(np.random.normal(0, 50 * (1 - progress)))
-                            dy = int(np.random.normal(0, 50 * (1 - progress)))
-                            y1_new = max(0, min(h - piece_h, y1 + dy))
-                            x1_new = max(0, min(w - piece_w, x1 + dx))
-                            y2_new = y1_new + piece_h
-                            x2_new = x1_new + piece_w
-                            shattered[y1_new:y2_new, x1_new:x2_new] = frame[y1:y2, x1:x2]
-                        else:
-                            shattered[y1:y2, x1:x2] = frame[y1:y2, x1:x2]
-                return shattered.astype(np.uint8)
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'fade':
-            if internal_position == 'start':
-                return clip.fx(vfx.fadein, duration)
-            else:
-                return clip.fx(vfx.fadeout, duration)
-
-        elif internal_type == 'dissolve':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    if t < duration:
-                        np.random.seed(42)
-                        mask = np.random.random((h, w))
-                        threshold = t / duration
-                        mask = mask < threshold
-                        mask = np.dstack([mask] * 3)
-                        return frame * mask
-                    return frame
-                else:
-                    remaining = clip.duration - t
-                    if remaining < duration:
-                        np.random.seed(42)
-                        mask = np.random.random((h, w))
-                        threshold = remaining / duration
-                        mask = mask < threshold
-                        mask = np.dstack([mask] * 3)
-                        return frame * mask
-                    return frame
-            new_clip = mp.VideoClip(make_frame, duration=clip.duration)
-            new_clip.fps = clip.fps
-            if clip.audio is not None:
-                new_clip = new_clip.set_audio(clip.audio)
-            return new_clip
-
-        elif internal_type == 'slide':
-            def get_combined_slide_position(t):
-                if callable(original_pos):
-                    original_x, original_y = original_pos(t)
-                else:
-                    original_x, original_y = original_pos
-                if original_x == 'center':
-                    original_x = 0
-                if original_y == 'center':
-                    original_y = 0
-                x_offset = original_x
-                if internal_position == 'start' and 0 <= t < duration:
-                    progress = t / duration
-                    x_offset = -clip_width * (1 - progress)
-                elif internal_position == 'end':
-                    remaining = max(0, clip.duration - t)
-                    if remaining < duration:
-                        progress = remaining / duration
-                        x_offset = -clip_width * (1 - progress)
-                return (x_offset, original_y)
-            return clip.set_position(get_combined_slide_position)
-
-        elif internal_type == 'zoom':
-            def get_zoom_scale(t):
-                if position == 'start':
-                    if t < duration:
-                        progress = t / duration
-                        scale = 0.1 + (0.9 * progress)
-                        return scale
-                    return 1.0
-                else:
-                    remaining = clip.duration - t
-                    if remaining < duration:
-                        progress = remaining / duration
-                        scale = 1.0 - (0.9 * (1 - progress))
-                        return scale
-                    return 1.0
-            centered_clip = clip.set_position(('center', 'center'))
-            def make_zoomed_frame(t):
-                scale = get_zoom_scale(t)
-                new_width = int(clip_width * scale)
-                new_height = int(clip_height * scale)
-                frame = clip.get_frame(t)
-                resized_frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
-                output_frame = np.zeros((clip_height, clip_width, 3), dtype=np.uint8)
-                y_offset = (clip_height - new_height) // 2
-                x_offset = (clip_width - new_width) // 2
-                output_frame[y_offset:y_offset + new_height, x_offset:x_offset + new_width] = resized_frame
-                return output_frame
-            zoomed_clip = mp.VideoClip(make_zoomed_frame, duration=clip.duration)
-            zoomed_clip.fps = clip.fps
-            if clip.audio is not None:
-                zoomed_clip = zoomed_clip.set_audio(clip.audio)
-            final_clip = zoomed_clip.set_position(('center', 'center'))
-            return final_clip
-
-        elif internal_type == 'wipe':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                mask = np.zeros((h, w))
-                if internal_position == 'start':
-                    if t < duration:
-                        edge = int(w * (t / duration))
-                        mask[:, :edge] = 1
-                    else:
-                        mask[:, :] = 1
-                else:
-                    remaining = clip.duration - t
-                    if remaining < duration:
-                        edge = int(w * (remaining / duration))
-                        mask[:, :edge] = 1
-                    else:
-                        mask[:, :] = 1
-                mask = np.dstack([mask] * 3)
-                return frame * mask
-            new_clip = mp.VideoClip(make_frame, duration=clip.duration)
-            new_clip.fps = clip.fps
-            if clip.audio is not None:
-                new_clip = new_clip.set_audio(clip.audio)
-            return new_clip
-
-        elif internal_type == 'rotate':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                center = (w // 2, h // 2)
-                if internal_position == 'start':
-                    if t < duration:
-                        angle = 360 * (1 - t / duration)
-                        scale = t / duration
-                    else:
-                        angle = 0
-                        scale = 1
-                else:
-                    remaining = clip.duration - t
-                    if remaining < duration:
-                        angle = 360 * (1 - remaining / duration)
-                        scale = remaining / duration
-                    else:
-                        angle = 0
-                        scale = 1
-                if scale > 0:
-                    matrix = cv2.getRotationMatrix2D(center, angle, scale)
-                    rotated = cv2.warpAffine(frame, matrix, (w, h))
-                    return rotated
-                return np.zeros_like(frame)
-            new_clip = mp.VideoClip(make_frame, duration=clip.duration)
-            new_clip.fps = clip.fps
-            if clip.audio is not None:
-                new_clip = new_clip.set_audio(clip.audio)
-            return new_clip
-
-        elif internal_type == 'blur':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                if internal_position == 'start':
-                    if t < duration:
-                        sigma = 20 * (1 - t / duration)
-                        return cv2.GaussianBlur(frame, (0, 0), sigma)
-                    return frame
-                else:
-                    remaining = clip.duration - t
-                    if remaining < duration:
-                        sigma = 20 * (1 - remaining / duration)
-                        return cv2.GaussianBlur(frame, (0, 0), sigma)
-                    return frame
-            new_clip = mp.VideoClip(make_frame, duration=clip.duration)
-            new_clip.fps = clip.fps
-            if clip.audio is not None:
-                new_clip = new_clip.set_audio(clip.audio)
-            return new_clip
-
-        # ---------------------------------------------------
-        # Novas transições
-        # ---------------------------------------------------
-
-        elif internal_type == 'glitch':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                output = frame.copy()
-                stripe_height = 5  # altura da faixa em pixels
-                for y in range(0, h, stripe_height):
-                    offset = int(np.random.normal(0, 30 * (1 - progress)))
-                    y_end = min(y + stripe_height, h)
-                    output[y:y_end, :] = np.roll(frame[y:y_end, :], shift=offset, axis=1)
-                return output
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'pixelate':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                # De 10% (muito pixelado) a 100% (normal)
-                scale = 0.1 + 0.9 * progress
-                new_w = max(1, int(w * scale))
-                new_h = max(1, int(h * scale))
-                small = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_NEAREST)
-                pixelated = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
-                return pixelated
-            return create_clip_with_audio(clip, make_frame)
-
-
-        elif internal_type == 'circle-wipe':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                center = (w // 2, h // 2)
-                max_radius = np.sqrt(center[0] ** 2 + center[1] ** 2)
-
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-
-                radius = progress * max_radius
-                Y, X = np.ogrid[:h, :w]
-                dist_from_center = np.sqrt((X - center[0]) ** 2 + (Y - center[1]) ** 2)
-                mask = (dist_from_center <= radius).astype(np.float32)
-                mask = np.dstack([mask, mask, mask])
-                return (frame * mask).astype(np.uint8)
-            return create_clip_with_audio(clip, make_frame)
-
-
-        elif internal_type == 'swirl':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                center = (w / 2, h / 2)
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                max_angle = 2 * np.pi
-                angle_offset = max_angle * (1 - progress)
-                X, Y = np.meshgrid(np.arange(w), np.arange(h))
-                Xc = X - center[0]
-                Yc = Y - center[1]
-                theta = np.arctan2(Yc, Xc) + angle_offset * np.exp(-((Xc**2 + Yc**2) / (2*(max(w, h)/2)**2)))
-                radius = np.sqrt(Xc**2 + Yc**2)
-                map_x = (radius * np.cos(theta) + center[0]).astype(np.float32)
-                map_y = (radius * np.sin(theta) + center[1]).astype(np.float32)
-                swirled = cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
-                return swirled
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'wave':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                amplitude = 10 * (1 - progress)
-                frequency = 2
-                X, Y = np.meshgrid(np.arange(w), np.arange(h))
-                shift = amplitude * np.sin(2 * np.pi * Y / 30 * frequency)
-                map_x = (X + shift).astype(np.float32)
-                map_y = Y.astype(np.float32)
-                waved = cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
-                return waved
-            return create_clip_with_audio(clip, make_frame)
-
-
-        elif internal_type == 'tile':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                tiles_x, tiles_y = 10, 10
-                tile_w = w // tiles_x
-                tile_h = h // tiles_y
-                np.random.seed(42)
-
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                    output = np.zeros_like(frame)
-
-                    for i in range(tiles_y):
-                        for j in range(tiles_x):
-                            threshold = np.random.rand()
-
-                            if progress > threshold:
-                                x1 = j * tile_w
-                                y1 = i * tile_h
-                                x2 = x1 + tile_w if j < tiles_x - 1 else w
-                                y2 = y1 + tile_h if i < tiles_y - 1 else h
-                                output[y1:y2, x1:x2] = frame[y1:y2, x1:x2]
-
-                else:  # 'end'
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                    output = frame.copy()
-
-                    for i in range(tiles_y):
-                        for j in range(tiles_x):
-                            threshold = np.random.rand()
-
-                            # Aqui, quanto maior (1 - progress), mais blocos serão removidos
-                            if (1 - progress) > threshold:
-                                x1 = j * tile_w
-                                y1 = i * tile_h
-                                x2 = x1 + tile_w if j < tiles_x - 1 else w
-                                y2 = y1 + tile_h if i < tiles_y - 1 else h
-                                output[y1:y2, x1:x2] = 0
-
-                return output
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'color-shift':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                max_offset = 20
-                offset = int(max_offset * (1 - progress))
-                b, g, r = cv2.split(frame)
-                M_right = np.float32([[1, 0, offset], [0, 1, 0]])
-                M_left = np.float32([[1, 0, -offset], [0, 1, 0]])
-                shifted_r = cv2.warpAffine(r, M_right, (w, h))
-                shifted_b = cv2.warpAffine(b, M_left, (w, h))
-                merged = cv2.merge([shifted_b, g, shifted_r])
-                return merged
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'ripple':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                center = (w / 2, h / 2)
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                amplitude = 5 * (1 - progress)
-                wavelength = 20
-                X, Y = np.meshgrid(np.arange(w), np.arange(h))
-                distance = np.sqrt((X - center[0])**2 + (Y - center[1])**2)
-                displacement = amplitude * np.sin(2 * np.pi * distance / wavelength)
-                eps = 1e-5
-                dx = displacement * (X - center[0]) / (distance + eps)
-                dy = displacement * (Y - center[1]) / (distance + eps)
-                map_x = (X + dx).astype(np.float32)
-                map_y = (Y + dy).astype(np.float32)
-                rippled = cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
-                return rippled
-            return create_clip_with_audio(clip, make_frame)
-
-        elif internal_type == 'spiral':
-            def make_frame(t):
-                frame = clip.get_frame(t)
-                h, w = frame.shape[:2]
-                center = (w / 2, h / 2)
-                if internal_position == 'start':
-                    progress = min(1, t / duration) if t < duration else 1
-                else:
-                    progress = max(0, (clip.duration - t) / duration) if t > clip.duration - duration else 1
-                max_angle = 2 * np.pi
-                angle_offset = max_angle * (1 - progress)
-                X, Y = np.meshgrid(np.arange(w), np.arange(h))
-                Xc = X - center[0]
-                Yc = Y - center[1]
-                radius = np.sqrt(Xc**2 + Yc**2)
-                theta = np.arctan2(Yc, Xc) + angle_offset
-                map_x = (radius * np.cos(theta) + center[0]).astype(np.float32)
-                map_y = (radius * np.sin(theta) + center[1]).astype(np.float32)
-                spiraled = cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
-                return spiraled
-            return create_clip_with_audio(clip, make_frame)
-
-        # Caso nenhuma transição seja aplicada, retorna o clipe original
-        return clip
-
+        ops = [transition_operator(clip, transition_type, duration, position, options)
+               for transition_type, position in transitions]
     except Exception as e:
         logger.error(f"Failed to apply transition: {str(e)}")
         return clip
+    ops = [op for op in ops if op is not None]
+    if not ops:
+        return clip
+
+    def make_frame(t):
+        frame = clip.get_frame(t)
+        for op in ops:
+            if op.active(t):
+                frame = op(frame, t)
+        return frame
+    return create_clip_with_audio(clip, make_frame)
+
+def apply_transition(clip, transition_type='fade-in', duration=1.0, position='start', options=None):
+    """Apply transition effect to a clip at the start or end."""
+    return apply_transitions(clip, [(transition_type, position)], duration, options)
+
+# Blends between an item and the next one, overlapping the two clips
+CROSSFADES = ('crossfade', 'dissolve', 'wipe', 'circle-wipe', 'heart')
+
+def link_crossfades(timeline):
+    """Split out the blends ('nextTransition') that join each item to the next.
+
+    Returns a copy of the timeline and the blend after each item; blends replace the adjoining transitions.
+    """
+    items = [dict(item) for item in timeline]
+    crossfades = []
+    for idx, item in enumerate(items):
+        kind = item.get('nextTransition', 'none')
+        if kind not in CROSSFADES:
+            if kind != 'none':
+                logger.warning(f"Unknown crossfade {kind}")
+            kind = None
+        if idx + 1 == len(items):
+            kind = None
+        if kind:
+            item['endTransition'] = 'none'
+            items[idx + 1]['startTransition'] = 'none'
+        crossfades.append(kind)
+    return items, crossfades
+
+def layout_clips(clips, crossfades, transition_duration=1.0):
+    """Start each clip where the previous one ends, or earlier by the overlap of a crossfade.
+
+    The overlap is the transition duration, capped at half of either clip.
+    """
+    placed = []
+    current_start = 0
+    for idx, clip in enumerate(clips):
+        clip = clip.set_start(current_start)
+        placed.append(clip)
+        current_start += clip.duration
+        if crossfades[idx] and idx + 1 < len(clips):
+            current_start -= min(transition_duration, clip.duration / 2, clips[idx + 1].duration / 2)
+    return placed
+
+def crossfade_frame(kind, outgoing, incoming, progress):
+    """Blend two clips' frames: progress 0 shows outgoing, 1 incoming."""
+    if kind == 'crossfade':
+        return cv2.addWeighted(outgoing, 1 - progress, incoming, progress, 0)
+    height, width = incoming.shape[:2]
+    # The incoming frame is revealed in the same order as the single-clip mask transitions
+    return cv2.copyTo(incoming, reveal_mask(width, height, kind, progress), outgoing.copy())
 
 
 def create_clip_with_audio(original_clip, make_frame_func):
     """Helper function to create a new clip while preserving audio"""
     new_clip = mp.VideoClip(make_frame_func, duration=original_clip.duration)
-    new_clip.fps = original_clip.fps
+    new_clip.fps = getattr(original_clip, 'fps', None)
     if original_clip.audio is not None:
         new_clip = new_clip.set_audio(original_clip.audio)
     return new_clip
 
-def process_video(timeline, output_path, target_resolution=None, background_audio=None):
-    """Process video clips according to timeline."""
+class SequentialTimelineClip(mp.VideoClip):
+    """Clips laid end to end, rendering only the clip playing at time t instead of compositing them all.
+
+    sources are released once playback leaves their clip; crossfades holds the blend (see CROSSFADES) into the next.
+    """
+
+    def __init__(self, clips, size, sources=None, crossfades=None):
+        super().__init__()
+        order = sorted(range(len(clips)), key=lambda i: clips[i].start)
+        self.clips = [clips[i] for i in order]
+        self.sources = [sources[i] for i in order] if sources else [None] * len(clips)
+        self.crossfades = [crossfades[i] for i in order] if crossfades else [None] * len(clips)
+        self.active_indices = set()
+        self.size = size
+        self.starts = [c.start for c in self.clips]
+        self.ends = [c.end for c in self.clips]
+        self.duration = self.end = max(self.ends) if self.ends else 0
+
+        fpss = [c.fps for c in self.clips if getattr(c, 'fps', None)]
+        self.fps = max(fpss) if fpss else None
+
+        audioclips = [c.audio for c in self.clips if c.audio is not None]
+        if audioclips:
+            self.audio = TimelineAudioClip(audioclips)
+
+        self.make_frame = self._make_frame
+
+    def active_clip_index(self, t):
+        """Return the index of the clip playing at time t, or None in a gap."""
+        idx = bisect.bisect_right(self.starts, t) - 1
+        if idx >= 0 and t < self.ends[idx]:
+            return idx
+        return None
+
+    def _activate(self, indices):
+        for idx in self.active_indices - indices:
+            release = getattr(self.sources[idx], 'release', None)
+            if release:
+                release()
+        self.active_indices = indices
+
+    def _covers_frame(self, clip, clip_time):
+        if clip.mask is not None or tuple(clip.size) != tuple(self.size):
+            return False
+        pos = clip.pos(clip_time)
+        if isinstance(pos, str):
+            return True
+        # With equal sizes every named position ('center', 'left', ...) is 0
+        return all(isinstance(p, str) or int(p) == 0 for p in pos)
+
+    def _make_frame(self, t):
+        idx = self.active_clip_index(t)
+        # The previous clip is still playing while it crossfades into this one
+        previous = idx - 1 if idx and self.crossfades[idx - 1] and t < self.ends[idx - 1] else None
+        self._activate({i for i in (previous, idx) if i is not None})
+        if idx is None:
+            width, height = self.size
+            return np.zeros((height, width, 3), dtype=np.uint8)
+
+        frame = self._clip_frame(self.clips[idx], t)
+        if previous is not None:
+            progress = (t - self.starts[idx]) / (self.ends[previous] - self.starts[idx])
+            frame = crossfade_frame(self.crossfades[previous], self._clip_frame(self.clips[previous], t), frame,
+                                    progress)
+        return frame
+
+    def _clip_frame(self, clip, t):
+        if self._covers_frame(clip, t - clip.start):
+            return clip.get_frame(t - clip.start)
+        width, height = self.size
+        return clip.blit_on(np.zeros((height, width, 3), dtype=np.uint8), t)
+
+class RenderProgressLogger(ProgressBarLogger):
+    """Forward MoviePy's audio-chunk and frame progress bars to a callback."""
+
+    def __init__(self, progress_callback):
+        super().__init__()
+        self.progress_callback = progress_callback
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if attr != 'index' or value < 0:
+            return
+        total = self.bars[bar]['total'] or 0
+        if bar == 't':
+            self.progress_callback('encode', value, total)
+        elif bar == 'chunk':
+            self.progress_callback('audio', value, total)
+
+def probe_media(path):
+    """Size, duration, frame rate and audio presence of a video file, without keeping a reader open."""
+    infos = ffmpeg_parse_infos(path)
+    if not infos.get('video_found'):
+        raise ValueError(f"No video stream in {os.path.basename(path)}")
+    return {
+        'size': tuple(infos['video_size']),
+        'duration': infos.get('video_duration') or infos['duration'],
+        'fps': infos.get('video_fps'),
+        'has_audio': infos.get('audio_found', False)
+    }
+
+class VideoSource:
+    """The FFmpeg reader of one video file, opened on the first frame read and closed by release()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = None
+
+    def get_frame(self, t):
+        if self.reader is None:
+            logger.debug(f"Opening decoder for {self.path}")
+            self.reader = FFMPEG_VideoReader(self.path)
+        return self.reader.get_frame(t)
+
+    def release(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+class AudioSource:
+    """The FFmpeg audio reader of one file, opened on the first chunk read and closed by release()."""
+
+    def __init__(self, path, fps=44100, buffersize=200000):
+        self.path = path
+        self.fps = fps
+        self.buffersize = buffersize
+        self.reader = None
+
+    def get_frame(self, t):
+        if self.reader is None:
+            logger.debug(f"Opening audio reader for {self.path}")
+            self.reader = FFMPEG_AudioReader(self.path, self.buffersize, fps=self.fps)
+        return self.reader.get_frame(t)
+
+    def release(self):
+        if self.reader is not None:
+            self.reader.close_proc()
+            self.reader = None
+
+class LazyAudioClip(mp.AudioClip):
+    """An AudioFileClip whose reader opens only once its sound is read."""
+
+    def __init__(self, path, duration, fps=44100):
+        super().__init__()
+        self.filename = path
+        self.source = AudioSource(path, fps)
+        self.fps = fps
+        # FFMPEG_AudioReader always decodes to stereo
+        self.nchannels = 2
+        self.duration = self.end = duration
+        self.make_frame = self.source.get_frame
+
+    def release(self):
+        self.source.release()
+
+    def close(self):
+        self.release()
+
+class TimelineAudioClip(mp.CompositeAudioClip):
+    """A CompositeAudioClip that releases each track's reader once the mix has passed its end."""
+
+    def __init__(self, clips):
+        super().__init__(clips)
+        mix = self.make_frame
+
+        def make_frame(t):
+            frame = mix(t)
+            start = np.min(t)
+            for clip in self.clips:
+                source = getattr(clip, 'source', None)
+                if source is not None and clip.end is not None and clip.end <= start:
+                    source.release()
+            return frame
+
+        self.make_frame = make_frame
+
+def palette_image(palette):
+    """A Pillow 'P' image carrying a (256, 1, 3) palette, for Image.quantize."""
+    image = Image.new('P', (1, 1))
+    image.putpalette(palette.tobytes())
+    return image
+
+def index_colors(frame, palette=None, palette_img=None):
+    """An RGB frame as (indices, palette) for cv2.applyColorMap, or None if it has over 256 colours.
+
+    The current palette is tried first and kept if it maps the frame exactly.
+    """
+    if palette is not None:
+        indices = np.asarray(Image.fromarray(frame).quantize(palette=palette_img, dither=Image.Dither.NONE))
+        if cv2.norm(cv2.applyColorMap(indices, palette), frame, cv2.NORM_INF) == 0:
+            return indices, palette
+
+    keys = (frame[..., 0].astype(np.uint32) << 16) | (frame[..., 1].astype(np.uint32) << 8) | frame[..., 2]
+    colors, indices = np.unique(keys, return_inverse=True)
+    if len(colors) > 256:
+        return None
+    palette = np.zeros((256, 1, 3), dtype=np.uint8)
+    palette[:len(colors), 0] = np.stack([colors >> 16, (colors >> 8) & 255, colors & 255], axis=-1)
+    return indices.reshape(frame.shape[:2]).astype(np.uint8), palette
+
+def decode_gif(path, max_bytes):
+    """Decode a GIF into (frames, starts) of index_colors entries, or None if over max_bytes."""
+    frames = []
+    starts = []
+    size = 0
+    # Summed in whole milliseconds so frame boundaries don't drift
+    elapsed = 0
+    palette = palette_img = None
+    with Image.open(path) as image:
+        for frame in ImageSequence.Iterator(image):
+            # Transparent pixels are white, as FFmpeg's decoder shows them
+            rgba = np.asarray(frame.convert('RGBA'))
+            rgb = np.where(rgba[..., 3:] == 0, np.uint8(255), rgba[..., :3])
+            entry = index_colors(rgb, palette, palette_img) or (rgb, None)
+            if entry[1] is not None and entry[1] is not palette:
+                palette = entry[1]
+                palette_img = palette_image(palette)
+
+            size += entry[0].nbytes
+            if size > max_bytes:
+                return None
+            frames.append(entry)
+            starts.append(elapsed / 1000)
+            delay = int(frame.info.get('duration', 0))
+            elapsed += delay or GIF_DEFAULT_DELAY_MS
+    return frames, starts
+
+class GifSource:
+    """The frames of a GIF, decoded into memory on the first frame read.
+
+    A GIF whose frame table would exceed max_bytes is streamed from FFmpeg instead.
+    """
+
+    def __init__(self, path, info, max_bytes=GIF_MEMORY_BYTES):
+        self.path = path
+        self.info = info
+        self.max_bytes = max_bytes
+        self.frames = None
+        self.starts = None
+        self.stream = None
+
+    def _open(self):
+        width, height = self.info['size']
+        estimate = width * height * round(self.info['duration'] * (self.info['fps'] or 1000 / GIF_DEFAULT_DELAY_MS))
+        table = decode_gif(self.path, self.max_bytes) if estimate <= self.max_bytes else None
+        if table is None:
+            logger.info(f"Streaming {self.path}, its frames exceed {self.max_bytes} bytes")
+            self.stream = VideoSource(self.path)
+        else:
+            self.frames, self.starts = table
+            logger.debug(f"Decoded {len(self.frames)} frames of {self.path}")
+
+    def get_frame(self, t):
+        if self.frames is None and self.stream is None:
+            self._open()
+        frame_cache = FrameCache.get_instance()
+        if self.stream is not None:
+            return frame_cache.get_frame(self.path, self.stream.get_frame, t)
+        idx = min(max(bisect.bisect_right(self.starts, t) - 1, 0), len(self.frames) - 1)
+        return frame_cache.get_frame(self.path, lambda _: self.expand(idx), self.starts[idx])
+
+    def expand(self, idx):
+        indices, palette = self.frames[idx]
+        return indices if palette is None else cv2.applyColorMap(indices, palette)
+
+    def release(self):
+        if self.stream is not None:
+            self.stream.release()
+        self.frames = self.starts = self.stream = None
+
+class LazyVideoClip(mp.VideoClip):
+    """A VideoFileClip laid out from probe_media, decoding only once its frames are read.
+
+    source, if given, replaces the FFmpeg reader (see GifSource).
+    """
+
+    def __init__(self, path, info, audio=False, source=None):
+        super().__init__()
+        self.filename = path
+        self.source = source or VideoSource(path)
+        self.size = info['size']
+        self.duration = self.end = info['duration']
+        self.fps = info['fps']
+        self.make_frame = self.source.get_frame
+        if audio and info['has_audio']:
+            self.audio = LazyAudioClip(path, info['duration'])
+
+    def release(self):
+        self.source.release()
+
+    def close(self):
+        self.release()
+        if self.audio:
+            self.audio.close()
+            self.audio = None
+
+def load_clip(item):
+    """Open the media of a timeline item as a clip of the requested duration."""
+    temp_path = item.get('filepath')
+    if not temp_path or not os.path.exists(temp_path):
+        raise ValueError(f"Media file not found for {item.get('filename', 'timeline item')}")
+
+    duration = float(item.get('duration', 5))
+    keep_audio = item.get('keepAudio', False)
+    # Decoded frames are shared by every clip of the same file
+    frame_cache = FrameCache.get_instance()
+
+    try:
+        if temp_path.lower().endswith(('.png', '.jpg', '.jpeg')):
+            clip = mp.ImageClip(temp_path, duration=duration)
+        elif temp_path.lower().endswith('.gif'):
+            # Decoded once and looped from memory
+            info = probe_media(temp_path)
+            clip = LazyVideoClip(temp_path, info, source=GifSource(temp_path, info)).loop(duration=duration)
+        else:
+            # Probing fails for files without a readable video stream
+            clip = frame_cache.wrap(LazyVideoClip(temp_path, probe_media(temp_path), keep_audio), temp_path)
+
+        logger.info(f"Successfully loaded clip: {item['filename']}")
+        return clip
+    except Exception as e:
+        logger.error(f"Failed to load clip {item['filename']}: {str(e)}")
+        raise
+
+def build_item_clip(item, clip, target_width, target_height, transition_duration=1.0, profile=None):
+    """Fit, filter and add the start/end transitions of one timeline item.
+
+    profile, if given, sets how many threads run the filters.
+    """
+    # Resize clip to target resolution with proper centering
+    clip = resize_clip_maintain_aspect(clip, target_width, target_height,
+                                       item.get('fit', 'contain'), item.get('interpolation'))
+
+    # Apply filters
+    filters = item_filters(item)
+    if filters:
+        if profile:
+            clip = apply_filters(clip, filters, profile.filter_workers, profile.filter_batch)
+        else:
+            clip = apply_filters(clip, filters)
+
+    # Apply transitions
+    start_transition = item.get('startTransition', 'fade-in')
+    end_transition = item.get('endTransition', 'fade-out')
+
+    options = dict(item.get('transitionOptions') or {}, seed=transition_seed(item))
+    clip = apply_transitions(clip, [(start_transition, 'start'), (end_transition, 'end')],
+                             transition_duration, options)
+
+    return clip
+
+def is_still(item, clip):
+    """True if an item's frames are all the same image outside its transition windows."""
+    return isinstance(clip, mp.ImageClip) and not is_temporal(item_filters(item))
+
+def transition_frames(item, times, transition_duration=1.0):
+    """How many of the frames at times (ascending) fall in the item's start and end transitions."""
+    times = np.asarray(times)
+    duration = float(item.get('duration', 5))
+    head = tail = 0
+    if item.get('startTransition', 'fade-in') != 'none':
+        head = int(np.sum(times < transition_duration))
+    if item.get('endTransition', 'fade-out') != 'none':
+        tail = int(np.sum(times[head:] > duration - transition_duration))
+    return head, tail
+
+def mix_background_audio(audio, background_audio_clip, duration):
+    """Loop or trim background audio to duration and mix it under audio."""
+    # Loop the background audio if it's shorter than the video
+    if background_audio_clip.duration < duration:
+        num_loops = int(np.ceil(duration / background_audio_clip.duration))
+        background_audio_clip = mp.concatenate_audioclips([background_audio_clip] * num_loops)
+    # Trim the audio if it's longer than the video
+    background_audio_clip = background_audio_clip.subclip(0, duration)
+
+    # Combine video's original audio (if any) with background audio
+    if audio is not None:
+        return mp.CompositeAudioClip([
+            background_audio_clip.volumex(0.5),  # Background audio at 50% volume
+            audio.volumex(1.0)  # Original audio at 100% volume
+        ])
+    return background_audio_clip
+
+def process_video(timeline, output_path, target_resolution=None, background_audio=None, progress_callback=None,
+                  profile=None, scale=1.0, time_range=None):
+    """Process video clips according to timeline.
+
+    time_range, a (start, end) pair in seconds, renders only that part; progress_callback(stage, current, total).
+    """
+    def report(stage, current, total):
+        if progress_callback:
+            try:
+                progress_callback(stage, current, total)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {str(e)}")
+
+    profile = profile or OutputProfile.named(DEFAULT_PROFILE)
+    timeline, crossfades = link_crossfades(timeline)
     input_clips = []
     clips = []
-    temp_files = []  # Track temporary files for cleanup
     transition_duration = 1.0  # Default transition duration
 
     try:
@@ -878,52 +1129,14 @@ def process_video(timeline, output_path, target_resolution=None, background_audi
             background_audio_clip = None
             if background_audio:
                 try:
-                    # Decode base64 data and save to temporary file
-                    binary_data = base64.b64decode(background_audio)
-                    temp_audio_path = os.path.join(temp_dir, 'background_audio.mp3')
-                    with open(temp_audio_path, 'wb') as f:
-                        f.write(binary_data)
-                    background_audio_clip = mp.AudioFileClip(temp_audio_path)
-                    temp_files.append(temp_audio_path)
+                    background_audio_clip = mp.AudioFileClip(background_audio)
                 except Exception as e:
                     logger.error(f"Failed to load background audio: {str(e)}")
 
             # Load all clips first
-            for item in timeline:
-                file_data = item.get('file_data')
-                if not file_data:
-                    raise ValueError("No file data provided")
-
-                # Decode base64 data and save to temporary file
-                binary_data = base64.b64decode(file_data)
-                temp_path = os.path.join(temp_dir, item['filename'])
-                with open(temp_path, 'wb') as f:
-                    f.write(binary_data)
-                temp_files.append(temp_path)
-
-                duration = float(item.get('duration', 5))
-                keep_audio = item.get('keepAudio', False)
-
-                try:
-                    if item['filename'].lower().endswith(('.png', '.jpg', '.jpeg')):
-                        clip = mp.ImageClip(temp_path, duration=duration)
-                    elif item['filename'].lower().endswith('.gif'):
-                        clip = mp.VideoFileClip(temp_path).loop(duration=duration)
-                    else:
-                        # Add error handling for video frame reading
-                        clip = mp.VideoFileClip(temp_path)
-                        # Verify clip can be read
-                        test_frame = clip.get_frame(0)
-                        if test_frame is None or len(test_frame.shape) != 3:
-                            raise ValueError(f"Invalid video frame in {item['filename']}")
-                        if not keep_audio:
-                            clip = clip.without_audio()
-
-                    input_clips.append(clip)
-                    logger.info(f"Successfully loaded clip: {item['filename']}")
-                except Exception as e:
-                    logger.error(f"Failed to load clip {item['filename']}: {str(e)}")
-                    raise
+            for idx, item in enumerate(timeline):
+                report('decode', idx, len(timeline))
+                input_clips.append(load_clip(item))
 
             # Determine target resolution from loaded clips
             if target_resolution:
@@ -931,68 +1144,49 @@ def process_video(timeline, output_path, target_resolution=None, background_audi
             else:
                 target_width, target_height = get_max_resolution(input_clips)
                 logger.info(f"Using max resolution from media: {target_width}x{target_height}")
+            if scale != 1.0:
+                target_width, target_height = scale_resolution(target_width, target_height, scale)
+                logger.info(f"Rendering scaled to {target_width}x{target_height}")
 
             # Process each clip
             for idx, (item, clip) in enumerate(zip(timeline, input_clips)):
+                report('filter', idx, len(timeline))
                 try:
-                    # Resize clip to target resolution with proper centering
-                    clip = resize_clip_maintain_aspect(clip, target_width, target_height)
-                    clip.set_position(('center', 'center'))
-
-                    # Apply filters
-                    if item.get('filter'):
-                        clip = apply_filter(clip, item['filter'])
-
-                    # Apply transitions
-                    start_transition = item.get('startTransition', 'fade-in')
-                    end_transition = item.get('endTransition', 'fade-out')
-
-                    if start_transition != 'none':
-                        clip = apply_transition(clip, start_transition, transition_duration, 'start')
-                    if end_transition != 'none':
-                        clip = apply_transition(clip, end_transition, transition_duration, 'end')
-
-                    clips.append(clip)
+                    clips.append(build_item_clip(item, clip, target_width, target_height, transition_duration,
+                                                 profile))
                     logger.info(f"Successfully processed clip {idx + 1}/{len(timeline)}")
                 except Exception as e:
                     logger.error(f"Failed to process clip {idx + 1}: {str(e)}")
                     raise
 
-            # Ensure clips don't overlap during transitions by calculating proper start times
-            final_clips = []
-            current_start = 0
-            for idx, clip in enumerate(clips):
-                # Set the start time for the current clip
-                clip = clip.set_start(current_start)
-                final_clips.append(clip)
-
-                # Calculate the next start time:
-                # Move the start time by the full duration of the current clip
-                current_start += clip.duration
-
-            final_clip = mp.CompositeVideoClip(final_clips, size=(target_width, target_height))
+            # Clips follow each other, overlapping only where they crossfade
+            final_clips = layout_clips(clips, crossfades, transition_duration)
+            final_clip = SequentialTimelineClip(final_clips, size=(target_width, target_height), sources=input_clips,
+                                                crossfades=crossfades)
 
             # Add background audio if provided
             if background_audio_clip:
-                # Loop the background audio if it's shorter than the video
-                if background_audio_clip.duration < final_clip.duration:
-                    num_loops = int(np.ceil(final_clip.duration / background_audio_clip.duration))
-                    background_audio_clip = mp.concatenate_audioclips([background_audio_clip] * num_loops)
-                # Trim the audio if it's longer than the video
-                background_audio_clip = background_audio_clip.subclip(0, final_clip.duration)
-
-                # Combine video's original audio (if any) with background audio
-                if final_clip.audio is not None:
-                    final_audio = mp.CompositeAudioClip([
-                        background_audio_clip.volumex(0.5),  # Background audio at 50% volume
-                        final_clip.audio.volumex(1.0)  # Original audio at 100% volume
-                    ])
-                else:
-                    final_audio = background_audio_clip
-
-                final_clip = final_clip.set_audio(final_audio)
-
-            final_clip.write_videofile(output_path, codec='libx264', audio_codec='aac', fps=24)
+                final_clip = final_clip.set_audio(
+                    mix_background_audio(final_clip.audio, background_audio_clip, final_clip.duration))
+
+            if time_range:
+                # Only frames inside the range are ever requested from the clips
+                start = min(max(0, time_range[0]), final_clip.duration)
+                end = min(time_range[1], final_clip.duration)
+                if end <= start:
+                    raise ValueError('Time range is outside the timeline')
+                final_clip = final_clip.subclip(start, end)
+
+            write_logger = RenderProgressLogger(report) if progress_callback else 'bar'
+            # Keep the temporary audio track out of the cwd, where concurrent renders would collide
+            temp_audiofile = os.path.join(temp_dir, 'audio.m4a')
+            fps = profile.resolve_fps(input_clips)
+            logger.info(f"Encoding with profile '{profile.name}' at {fps} fps")
+            final_clip.write_videofile(output_path, temp_audiofile=temp_audiofile, logger=write_logger,
+                                       **profile.write_kwargs(fps))
+
+            cache_stats = FrameCache.get_instance().stats()
+            logger.info(f"Frame cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
             # Cleanup clips to free memory
             for clip in input_clips + clips: